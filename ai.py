@@ -0,0 +1,139 @@
+import time
+
+from sim import (Simulation, DEFAULT_RULES, ARENA_WIDTH, ARENA_HEIGHT, TICK_RATE,
+                 INPUT_UP, INPUT_LEFT, INPUT_RIGHT, INPUT_ATTACK, snapshot_state)
+
+# CPU opponent that plans by playing the match forward.
+#
+# Every DECIDE_SECONDS it tries each of a handful of key combinations with
+# Monte Carlo rollouts: hold the combination for HOLD_SECONDS while the
+# opponent keeps doing what it appears to be doing, then both sides press
+# random combinations out to the horizon. Whichever combination scores best
+# on average (damage traded, knockouts and closing the distance) is held
+# until the next decision.
+#
+# Rollouts run on a model simulation with the match's rules at
+# PLAN_TICK_RATE, coarser than the real one, so each costs a few dozen ticks.
+# The state a decision starts from is one immutable snapshot that every
+# rollout restores the model from; nothing is copied per rollout. Rollouts
+# stop at a time budget, so difficulty is how many fit in it, or at a fixed
+# count for reproducible headless runs.
+
+PLAN_TICK_RATE = 30
+DECIDE_SECONDS = 0.1
+HOLD_SECONDS = 0.15  # How long a combination is pressed within a rollout
+HORIZON_SECONDS = 0.6
+ROLLOUTS = 60  # Per decision when there is no time budget
+WIN_SCORE = 1000
+DISTANCE_WEIGHT = 0.05  # Score lost per pixel between the fighters
+
+# Seconds of search per decision
+DIFFICULTIES = {
+    "easy": 0.0005,
+    "normal": 0.002,
+    "hard": 0.006,
+}
+
+CANDIDATES = (
+    0,
+    INPUT_LEFT,
+    INPUT_RIGHT,
+    INPUT_UP,
+    INPUT_UP | INPUT_LEFT,
+    INPUT_UP | INPUT_RIGHT,
+    INPUT_ATTACK,
+    INPUT_ATTACK | INPUT_LEFT,
+    INPUT_ATTACK | INPUT_RIGHT,
+    INPUT_ATTACK | INPUT_UP,
+)
+
+
+def guess_inputs(fighter):
+    # The keys a fighter seems to be holding, judging by its last tick
+    bits = 0
+    if fighter.x < fighter.prev_x:
+        bits |= INPUT_LEFT
+    elif fighter.x > fighter.prev_x:
+        bits |= INPUT_RIGHT
+    if fighter.jumping and fighter.velocity_y < 0:
+        bits |= INPUT_UP
+    if fighter.attacking:
+        bits |= INPUT_ATTACK
+    return bits
+
+
+class PlannerPolicy:
+    plans = True  # make_policy hands it the match's simulation to model
+
+    def __init__(self, rng, sim=None, budget=None, rollouts=None, clock=time.perf_counter):
+        # budget: seconds per decision; rollouts: count per decision. With
+        # both, whichever runs out first ends the search, and with neither
+        # there are ROLLOUTS
+        self.rng = rng
+        self.budget = budget
+        self.rollouts = ROLLOUTS if budget is None and rollouts is None else rollouts
+        self.clock = clock
+        tick_rate = sim.tick_rate if sim is not None else TICK_RATE
+        self.model = Simulation(sim.width if sim is not None else ARENA_WIDTH,
+                                sim.height if sim is not None else ARENA_HEIGHT,
+                                tick_rate=PLAN_TICK_RATE,
+                                rules=sim.rules if sim is not None else DEFAULT_RULES)
+        self.decide_ticks = max(1, round(DECIDE_SECONDS * tick_rate))
+        self.hold_ticks = max(1, round(HOLD_SECONDS * PLAN_TICK_RATE))
+        self.horizon_ticks = max(self.hold_ticks, round(HORIZON_SECONDS * PLAN_TICK_RATE))
+        self.bits = 0
+        self.wait = 0  # Ticks until the next decision
+
+    def act(self, state, index):
+        self.wait -= 1
+        if self.wait <= 0:
+            self.bits = self.decide(state, index)
+            self.wait = self.decide_ticks
+        return self.bits
+
+    def decide(self, state, index):
+        root = snapshot_state(state)
+        theirs = guess_inputs(state.fighters[1 - index])
+        totals = [0.0] * len(CANDIDATES)
+        counts = [0] * len(CANDIDATES)
+        deadline = self.clock() + self.budget if self.budget is not None else None
+
+        # Round robin, so every candidate gets its share however early the
+        # budget runs out, and at least one rollout each unless capped lower
+        n = 0
+        while True:
+            i = n % len(CANDIDATES)
+            totals[i] += self.rollout(root, index, CANDIDATES[i], theirs)
+            counts[i] += 1
+            n += 1
+            if self.rollouts is not None and n >= self.rollouts:
+                break
+            if deadline is not None and n >= len(CANDIDATES) and self.clock() >= deadline:
+                break
+        # A rollout cap under len(CANDIDATES) leaves some untried
+        best = max((i for i in range(len(CANDIDATES)) if counts[i]), key=lambda i: totals[i] / counts[i])
+        return CANDIDATES[best]
+
+    def rollout(self, root, index, mine, theirs):
+        model = self.model
+        model.restore(root)
+        state = model.state
+        me = state.fighters[index]
+        them = state.fighters[1 - index]
+        my_health, their_health = me.health, them.health
+
+        rng = self.rng
+        step = model.step
+        hold = self.hold_ticks
+        for tick in range(self.horizon_ticks):
+            if tick and tick % hold == 0:
+                mine = rng.choice(CANDIDATES)
+                theirs = rng.choice(CANDIDATES)
+            step((mine, theirs) if index == 0 else (theirs, mine))
+            if state.winner is not None:
+                break
+
+        score = (their_health - them.health) - (my_health - me.health)
+        if state.winner is not None:
+            score += WIN_SCORE if state.winner == index + 1 else -WIN_SCORE
+        return score - DISTANCE_WEIGHT * abs(them.x - me.x)
@@ -0,0 +1,243 @@
+import numpy as np
+
+from collision import SpatialHash, HitTracker, find_hits
+from sim import (ARENA_WIDTH, ARENA_HEIGHT, BASE_TICK_RATE, TICK_RATE, DEFAULT_RULES,
+                 PLAYER_WIDTH, PLAYER_HEIGHT, SWORD_WIDTH, SWORD_HEIGHT, SWORD_IDLE_POS,
+                 INPUT_UP, INPUT_LEFT, INPUT_RIGHT, INPUT_ATTACK)
+
+# Many-entity arenas for the battle-royale variant.
+#
+# Entities live in an EntityStore as parallel NumPy arrays, one row each, and
+# ArenaSimulation steps every row with whole-array operations: the movement,
+# gravity and floor clamp of Simulation.move and the sword follow of
+# Player/Sword, at a cost that barely grows with the number of entities.
+# Sprites read rows through EntityView and never own any game state.
+#
+# Sword and projectile hits go through the collision module in bulk, with
+# teams never hurting each other.
+
+KIND_FIGHTER = 0
+KIND_PROJECTILE = 1  # Flies on its own velocity, ignores input, dies on landing
+
+INITIAL_CAPACITY = 64
+
+
+class EntityStore:
+    # Array columns, grown together when the store fills up
+    FLOAT_COLUMNS = ("x", "y", "prev_x", "prev_y", "velocity_x", "velocity_y",
+                     "width", "height", "health", "sword_x", "sword_y")
+    BOOL_COLUMNS = ("jumping", "attacking", "alive")
+    INT_COLUMNS = ("team", "kind", "attack_id")
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.count = 0
+        self.capacity = capacity
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        for name in self.BOOL_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=bool))
+        for name in self.INT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int64))
+
+    def grow(self):
+        self.capacity *= 2
+        for name in self.FLOAT_COLUMNS + self.BOOL_COLUMNS + self.INT_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, team, health, kind=KIND_FIGHTER, width=PLAYER_WIDTH, height=PLAYER_HEIGHT,
+            velocity_x=0.0, velocity_y=0.0):
+        if self.count == self.capacity:
+            self.grow()
+        i = self.count
+        self.count += 1
+        self.x[i] = self.prev_x[i] = x
+        self.y[i] = self.prev_y[i] = y
+        self.velocity_x[i] = velocity_x
+        self.velocity_y[i] = velocity_y
+        self.width[i] = width
+        self.height[i] = height
+        self.health[i] = health
+        self.sword_x[i], self.sword_y[i] = SWORD_IDLE_POS
+        self.jumping[i] = False
+        self.attacking[i] = False
+        self.alive[i] = True
+        self.team[i] = team
+        self.kind[i] = kind
+        self.attack_id[i] = 0
+        return i
+
+    def view(self, i):
+        return EntityView(self, i)
+
+
+class EntityView:
+    # Attribute access to one store row, shaped like sim.Fighter so the pg.py
+    # sprites can draw arena entities unchanged
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    x = property(lambda self: float(self.store.x[self.index]))
+    y = property(lambda self: float(self.store.y[self.index]))
+    prev_x = property(lambda self: float(self.store.prev_x[self.index]))
+    prev_y = property(lambda self: float(self.store.prev_y[self.index]))
+    velocity_y = property(lambda self: float(self.store.velocity_y[self.index]))
+    health = property(lambda self: float(self.store.health[self.index]))
+    jumping = property(lambda self: bool(self.store.jumping[self.index]))
+    attacking = property(lambda self: bool(self.store.attacking[self.index]))
+    alive = property(lambda self: bool(self.store.alive[self.index]))
+    team = property(lambda self: int(self.store.team[self.index]))
+
+    def rect(self):
+        store, i = self.store, self.index
+        return (float(store.x[i]), float(store.y[i]), float(store.width[i]), float(store.height[i]))
+
+    def sword_rect(self):
+        store, i = self.store, self.index
+        return (float(store.sword_x[i]), float(store.sword_y[i]), SWORD_WIDTH, SWORD_HEIGHT)
+
+
+class ArenaSimulation:
+    def __init__(self, width=ARENA_WIDTH, height=ARENA_HEIGHT, tick_rate=TICK_RATE, rules=DEFAULT_RULES,
+                 capacity=INITIAL_CAPACITY):
+        self.width = width
+        self.height = height
+        self.tick_rate = tick_rate
+        self.rules = rules
+        self.scale = BASE_TICK_RATE / tick_rate
+        self.store = EntityStore(capacity)
+        self.tick = 0
+        self.grid = SpatialHash()
+        self.hit_tracker = HitTracker()
+        self.next_attack_id = 1
+        # (attacker, target) entity indices hit during the last tick
+        self.hits = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        # Set once at most one team has fighters left; a draw when the last
+        # of every team fall on the same tick leaves no winner
+        self.finished = False
+        self.winner_team = None
+
+    def spawn_fighter(self, x, team):
+        return self.store.add(x, self.height // 2, team, self.rules.max_health)
+
+    def spawn_projectile(self, x, y, team, velocity_x, velocity_y=0.0, width=8, height=8):
+        return self.store.add(x, y, team, 1, KIND_PROJECTILE, width, height, velocity_x, velocity_y)
+
+    def step(self, inputs):
+        # inputs holds one INPUT_* bitmask per entity (ignored for projectiles)
+        store = self.store
+        n = store.count
+        rules = self.rules
+        scale = self.scale
+
+        x = store.x[:n]
+        y = store.y[:n]
+        velocity_x = store.velocity_x[:n]
+        velocity_y = store.velocity_y[:n]
+        width = store.width[:n]
+        height = store.height[:n]
+        jumping = store.jumping[:n]
+        alive = store.alive[:n]
+        inputs = np.asarray(inputs)[:n]
+        fighters = alive & (store.kind[:n] == KIND_FIGHTER)
+        projectiles = alive & (store.kind[:n] == KIND_PROJECTILE)
+
+        store.prev_x[:n] = x
+        store.prev_y[:n] = y
+
+        # Horizontal movement, left then right as in Simulation.move
+        left = fighters & ((inputs & INPUT_LEFT) != 0) & (x > 0)
+        x -= left * (rules.player_speed * scale)
+        right = fighters & ((inputs & INPUT_RIGHT) != 0) & (x + width < self.width)
+        x += right * (rules.player_speed * scale)
+        x += np.where(projectiles, velocity_x * scale, 0.0)
+
+        # Jumping and gravity
+        jump = fighters & ((inputs & INPUT_UP) != 0) & ~jumping
+        velocity_y[jump] = rules.jump_speed
+        jumping |= jump
+        falling = fighters | projectiles
+        velocity_y += falling * (rules.gravity * scale)
+        y += np.where(falling, velocity_y * scale, 0.0)
+
+        # Floor collision: fighters land, projectiles are spent
+        landed = falling & (y + height > self.height)
+        y[landed] = self.height - height[landed]
+        velocity_y[landed] = 0
+        jumping[landed & fighters] = False
+        alive[landed & projectiles] = False
+        alive[projectiles & ((x + width < 0) | (x > self.width))] = False
+
+        # Swords follow their owners while attacking and park off-screen otherwise
+        attacking = fighters & ((inputs & INPUT_ATTACK) != 0)
+        started = attacking & ~store.attacking[:n]
+        started_count = int(started.sum())
+        if started_count:
+            # Every new swing gets its own id, for one-hit-per-swing rules
+            store.attack_id[:n][started] = np.arange(self.next_attack_id, self.next_attack_id + started_count)
+            self.next_attack_id += started_count
+        store.attacking[:n] = attacking
+        store.sword_x[:n] = np.where(attacking, x + width // 2 - SWORD_WIDTH // 2, SWORD_IDLE_POS[0])
+        store.sword_y[:n] = np.where(attacking, y + height // 2 - SWORD_HEIGHT // 2, SWORD_IDLE_POS[1])
+
+        self.resolve_hits(n, attacking, projectiles)
+
+        self.tick += 1
+        return store
+
+    def resolve_hits(self, n, attacking, projectiles):
+        store = self.store
+        rules = self.rules
+        targets = np.flatnonzero(store.alive[:n] & (store.kind[:n] == KIND_FIGHTER))
+        swords = np.flatnonzero(attacking)
+        shots = np.flatnonzero(store.alive[:n] & projectiles)
+        attackers = np.concatenate((swords, shots))
+
+        # Swords and projectiles share one broad phase pass
+        widths = np.concatenate((np.full(len(swords), SWORD_WIDTH, dtype=np.float64), store.width[shots]))
+        heights = np.concatenate((np.full(len(swords), SWORD_HEIGHT, dtype=np.float64), store.height[shots]))
+        a, t = find_hits(
+            (np.concatenate((store.sword_x[swords], store.x[shots])),
+             np.concatenate((store.sword_y[swords], store.y[shots])),
+             widths, heights, store.team[attackers]),
+            (store.x[targets], store.y[targets], store.width[targets], store.height[targets], store.team[targets]),
+            self.grid)
+        attacker, target = attackers[a], targets[t]
+
+        by_sword = a < len(swords)
+        if rules.one_hit_per_swing:
+            fresh = self.hit_tracker.filter(store.attack_id[attacker[by_sword]], target[by_sword])
+            keep = np.ones(len(attacker), dtype=bool)
+            keep[np.flatnonzero(by_sword)[~fresh]] = False
+            attacker, target, by_sword = attacker[keep], target[keep], by_sword[keep]
+            self.hit_tracker.retire(store.attack_id[swords])
+            sword_damage = rules.sword_damage
+        else:
+            sword_damage = rules.sword_damage * self.scale
+
+        # A projectile hits at most one fighter and is spent doing it
+        shot_hits = ~by_sword
+        if shot_hits.any():
+            _, first = np.unique(attacker[shot_hits], return_index=True)
+            keep = by_sword.copy()
+            keep[np.flatnonzero(shot_hits)[first]] = True
+            attacker, target, by_sword = attacker[keep], target[keep], by_sword[keep]
+            store.alive[attacker[~by_sword]] = False
+
+        damage = np.where(by_sword, sword_damage, rules.sword_damage)
+        health = store.health[:n]
+        np.subtract.at(health, target, damage)
+        np.maximum(health, 0, out=health)
+        store.alive[target[health[target] <= 0]] = False
+        self.hits = (attacker, target)
+
+        if not self.finished:
+            standing = np.unique(store.team[:n][store.alive[:n] & (store.kind[:n] == KIND_FIGHTER)])
+            if len(standing) <= 1 and len(targets) > 1:
+                self.finished = True
+                self.winner_team = int(standing[0]) if len(standing) else None
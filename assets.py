@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+# Images are decoded once, scaled once per target size and converted to the
+# display format once. Scaled variants are also baked to CACHE_DIR as raw
+# pixels keyed by the source file's hash, so a later start or a fullscreen
+# toggle reads them back instead of decoding a JPEG and rescaling it.
+#
+# preload() starts the read, decode and scale of an image on a worker thread;
+# image() then only waits if that work is still running, and converts to the
+# display format itself since that has to happen on the main thread.
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ASSET_DIR, ".asset-cache")
+CACHE_VERSION = 1  # Bump when the baked file layout changes
+PRELOAD_WORKERS = 2
+
+
+class AssetManager:
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=CACHE_DIR):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.files = {}  # name -> raw file contents
+        self.hashes = {}  # name -> hex digest of the file contents
+        self.sources = {}  # name -> decoded, unscaled surface
+        self.variants = {}  # (name, size) -> scaled surface in display format
+        self.pending = {}  # (name, size) -> future of the scaled surface
+        self.executor = None
+
+    def read(self, name):
+        data = self.files.get(name)
+        if data is None:
+            with open(os.path.join(self.asset_dir, name), "rb") as f:
+                data = self.files[name] = f.read()
+            self.hashes[name] = hashlib.sha1(data).hexdigest()
+        return data
+
+    def source(self, name):
+        surface = self.sources.get(name)
+        if surface is None:
+            surface = self.sources[name] = pygame.image.load(io.BytesIO(self.read(name)), name)
+        return surface
+
+    def prepare(self, name, size):
+        # Everything short of the display conversion; safe on a worker thread
+        surface = self.load_baked(name, size)
+        if surface is None:
+            surface = self.scale(self.source(name), size)
+            self.save_baked(name, size, surface)
+        return surface
+
+    def preload(self, name, size):
+        size = (int(size[0]), int(size[1]))
+        key = (name, size)
+        if key in self.variants or key in self.pending:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(PRELOAD_WORKERS, thread_name_prefix="preload")
+        self.pending[key] = self.executor.submit(self.prepare, name, size)
+
+    def image(self, name, size):
+        size = (int(size[0]), int(size[1]))
+        key = (name, size)
+        surface = self.variants.get(key)
+        if surface is not None:
+            return surface
+
+        future = self.pending.pop(key, None)
+        # A failed preload raises its error here, where the image is needed
+        surface = future.result() if future is not None else self.prepare(name, size)
+
+        if pygame.display.get_surface() is not None:
+            if surface.get_flags() & pygame.SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+        self.variants[key] = surface
+        return surface
+
+    def scale(self, surface, size):
+        if surface.get_bitsize() < 24:
+            # smoothscale only handles 24 and 32 bit surfaces
+            return pygame.transform.scale(surface, size)
+        return pygame.transform.smoothscale(surface, size)
+
+    def baked_path(self, name, size, pixel_format):
+        self.read(name)  # Makes sure the hash is known
+        return os.path.join(self.cache_dir, "%s-v%d-%dx%d-%s.raw" % (
+            self.hashes[name], CACHE_VERSION, size[0], size[1], pixel_format.lower()))
+
+    def load_baked(self, name, size):
+        for pixel_format in ("RGB", "RGBA"):
+            path = self.baked_path(name, size, pixel_format)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                return pygame.image.frombytes(data, size, pixel_format)
+            except (OSError, ValueError, pygame.error):
+                continue
+        return None
+
+    def save_baked(self, name, size, surface):
+        pixel_format = "RGBA" if surface.get_flags() & pygame.SRCALPHA else "RGB"
+        path = self.baked_path(name, size, pixel_format)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated variant
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pygame.image.tobytes(surface, pixel_format))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # The cache is only an optimization; a read-only tree still works
+
+    def shutdown(self):
+        # Drops preloads that have not started; running ones finish
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.pending.clear()
@@ -0,0 +1,156 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from bots import POLICIES, make_policy
+from sim import Rules, Simulation, TICK_RATE
+
+# Headless bot-vs-bot matches across a process pool, for balance sweeps.
+#
+#   python batch.py --matches 10000 --policy1 chaser --policy2 jumper \
+#       --set sword_damage=3,5,8 --set jump_speed=-12,-15 --out results.jsonl
+#
+# Every combination of --set values plays --matches matches. Results stream to
+# JSONL or CSV as they finish, one row per match.
+
+MAX_MATCH_SECONDS = 300  # Matches still undecided after this count as draws
+RESULT_FIELDS = ["match", "seed", "policy1", "policy2", *Rules.FIELDS,
+                 "winner", "double_ko", "ticks", "duration", "damage1", "damage2", "health1", "health2"]
+
+
+def play_match(job):
+    index, seed, policy1, policy2, overrides, tick_rate, max_ticks = job
+    rng = random.Random(seed)
+    rules = Rules(**overrides)
+    sim = Simulation(tick_rate=tick_rate, rules=rules)
+    bot1 = make_policy(policy1, random.Random(rng.getrandbits(64)), sim)
+    bot2 = make_policy(policy2, random.Random(rng.getrandbits(64)), sim)
+
+    # No clock here: ticks run back to back as fast as the CPU allows
+    state = sim.state
+    step = sim.step
+    while state.winner is None and state.tick < max_ticks:
+        state = step((bot1.act(state, 0), bot2.act(state, 1)))
+
+    # The simulation names player 2 the winner of a knockout trade; a batch
+    # counts it as a draw so the order of the players cannot skew a sweep
+    fighter1, fighter2 = state.fighters
+    double_ko = fighter1.health <= 0 and fighter2.health <= 0
+    result = {"match": index, "seed": seed, "policy1": policy1, "policy2": policy2}
+    result.update(rules.as_dict())
+    result.update({
+        "winner": 0 if double_ko else state.winner or 0,  # 0 for a draw on time or a double KO
+        "double_ko": double_ko,
+        "ticks": state.tick,
+        "duration": state.tick / tick_rate,
+        "damage1": rules.max_health - fighter2.health,  # Dealt by player 1
+        "damage2": rules.max_health - fighter1.health,
+        "health1": fighter1.health,
+        "health2": fighter2.health,
+    })
+    return result
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_sweep(text):
+    # "sword_damage=3,5,8" -> ("sword_damage", [3, 5, 8])
+    name, sep, values = text.partition("=")
+    if not sep or name not in Rules.FIELDS:
+        raise argparse.ArgumentTypeError(
+            f"expected RULE=V1,V2,... with RULE one of: {', '.join(Rules.FIELDS)}")
+    try:
+        return name, [parse_number(value) for value in values.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad value list for {name}: {values}") from None
+
+
+def make_jobs(args):
+    names = [name for name, _ in args.set]
+    grid = itertools.product(*(values for _, values in args.set))
+    max_ticks = int(MAX_MATCH_SECONDS * args.tick_rate)
+    index = 0
+    for values in grid:
+        overrides = dict(zip(names, values))
+        for _ in range(args.matches):
+            # Seeds come from the base seed and the match number, so a run is
+            # reproducible whatever the worker count or completion order
+            seed = random.Random(f"{args.seed}:{index}").getrandbits(32)
+            yield (index, seed, args.policy1, args.policy2, overrides, args.tick_rate, max_ticks)
+            index += 1
+
+
+class JsonlWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        self.stream.write(json.dumps(result) + "\n")
+
+
+class CsvWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=RESULT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, result):
+        self.writer.writerow(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless Pixel Gladiators bot matches.")
+    parser.add_argument("--matches", type=int, default=1000, help="matches per parameter combination")
+    parser.add_argument("--policy1", choices=sorted(POLICIES), default="chaser")
+    parser.add_argument("--policy2", choices=sorted(POLICIES), default="chaser")
+    parser.add_argument("--set", type=parse_sweep, action="append", default=[], metavar="RULE=V1,V2",
+                        help="sweep a rule over a list of values; repeat for a grid")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=64, help="matches handed to a worker at a time")
+    parser.add_argument("--out", default="-", help="output file, '-' for stdout")
+    parser.add_argument("--format", choices=["jsonl", "csv"],
+                        help="output format, guessed from --out by default")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("csv" if args.out.endswith(".csv") else "jsonl")
+    stream = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    writer = CsvWriter(stream) if output_format == "csv" else JsonlWriter(stream)
+
+    start = time.perf_counter()
+    wins = [0, 0, 0]  # Draws, player 1, player 2
+    double_kos = 0
+    jobs = make_jobs(args)
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    try:
+        results = pool.imap_unordered(play_match, jobs, args.chunk_size) if pool else map(play_match, jobs)
+        for result in results:
+            writer.write(result)
+            wins[result["winner"]] += 1
+            double_kos += result["double_ko"]
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if stream is not sys.stdout:
+            stream.close()
+
+    elapsed = time.perf_counter() - start
+    total = sum(wins)
+    print(f"{total} matches in {elapsed:.2f}s ({total / elapsed:.0f}/s): "
+          f"player 1 won {wins[1]}, player 2 won {wins[2]}, {wins[0]} draws ({double_kos} double KOs)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
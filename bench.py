@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+# Offscreen rendering; must be set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+import pg
+from sim import Simulation, TICK_RATE
+
+# Benchmarks for the simulation and rendering hot paths.
+#
+#   python bench.py --out baseline.json
+#   python bench.py --compare baseline.json
+#
+# Every benchmark times a fixed, seeded workload several times and reports
+# the median and best time per operation. With --compare, a best time more
+# than --threshold slower than the baseline's is flagged and the exit status
+# is 1; the best run is the one least disturbed by the rest of the machine.
+# Only compare runs from the same machine.
+
+REPEAT = 5
+THRESHOLD = 0.10  # Slowdown that counts as a regression
+STATES = ("MENU", "PREP", "CUSTOMIZE", "PLAYING", "GAME_OVER")
+
+
+def measure(fn, ops, repeat):
+    # fn(ops) runs the workload ops times; the result is seconds per op
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(ops)
+        times.append((time.perf_counter() - start) / ops)
+    return {"median": statistics.median(times), "min": min(times), "ops": ops, "repeat": repeat}
+
+
+def seeded_inputs(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randrange(32), rng.randrange(32)) for _ in range(count)]
+
+
+def bench_sim_step(repeat, scale):
+    # Pure simulation ticks: movement, swords and damage
+    inputs = seeded_inputs(1000)
+
+    def run(ops):
+        sim = Simulation(tick_rate=TICK_RATE)
+        for i in range(ops):
+            if sim.state.winner is not None:
+                sim.reset()
+            sim.step(inputs[i % len(inputs)])
+
+    return measure(run, 20000 * scale, repeat)
+
+
+def bench_game_tick(repeat, scale):
+    # A simulation tick plus the Player/Sword/HealthBar sprite updates
+    game = pg.Game()
+    inputs = seeded_inputs(1000)
+
+    def run(ops):
+        game.setup_game_objects()
+        for i in range(ops):
+            if game.sim.state.winner is not None:
+                game.setup_game_objects()
+            game.sim.step(inputs[i % len(inputs)])
+            game.all_sprites.update(1.0)
+
+    return measure(run, 5000 * scale, repeat)
+
+
+def render_frame(game, state):
+    game.state = state
+    game.run_frame(1 / pg.FPS)
+    game.present(state)
+
+
+def bench_render(state, full, repeat, scale):
+    # One frame of a state's scene plus present(): every frame a full
+    # redraw, or the steady dirty-rect frames in between
+    game = pg.Game()
+    game.winner = 1
+    game.setup_game_objects()
+    render_frame(game, state)
+
+    def run(ops):
+        for _ in range(ops):
+            game.needs_redraw = full
+            # Idle screens sleep until input; a no-op event wakes them at once
+            pygame.event.post(pygame.event.Event(pygame.USEREVENT))
+            render_frame(game, state)
+            if game.state != state:
+                game.setup_game_objects()
+
+    return measure(run, (100 if full else 2000) * scale, repeat)
+
+
+def bench_toggle_fullscreen(repeat, scale):
+    # Both ways, each followed by the full redraw it forces
+    game = pg.Game()
+    render_frame(game, "MENU")
+
+    def run(ops):
+        for _ in range(ops):
+            game.toggle_fullscreen()
+            render_frame(game, "MENU")
+
+    return measure(run, 10 * scale, repeat)
+
+
+def bench_startup(repeat, scale):
+    # Process start to the first frame on screen, in a fresh interpreter.
+    # The clock stops when the child says it is there, not when it exits
+    def run(ops):
+        for _ in range(ops):
+            child = subprocess.Popen([sys.executable, __file__, "--first-frame"], stdout=subprocess.PIPE)
+            child.stdout.readline()
+            child.communicate()
+
+    return measure(run, 2 * scale, repeat)
+
+
+def first_frame():
+    pg.init_display()
+    render_frame(pg.Game(), "MENU")
+    print("first frame", flush=True)
+    pg.ASSETS.shutdown()
+
+
+def run_benchmarks(names, repeat, scale):
+    pg.init_display()
+    benchmarks = {
+        "sim_step": bench_sim_step,
+        "game_tick": bench_game_tick,
+        "toggle_fullscreen": bench_toggle_fullscreen,
+        "startup": bench_startup,
+    }
+    for state in STATES:
+        name = state.lower()
+        benchmarks[f"render_{name}_full"] = lambda repeat, scale, state=state: bench_render(state, True, repeat, scale)
+        benchmarks[f"render_{name}_steady"] = lambda repeat, scale, state=state: bench_render(state, False, repeat, scale)
+
+    results = {}
+    for name, bench in benchmarks.items():
+        if names and not any(part in name for part in names):
+            continue
+        result = results[name] = bench(repeat, scale)
+        print(f"{name:28} {1e6 * result['median']:12.2f} us/op  ({1 / result['median']:10.0f} ops/s)",
+              file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns the names of benchmarks that got slower than the threshold allows
+    regressions = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["min"] / old["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:28} {1e6 * old['min']:12.2f} -> {1e6 * result['min']:12.2f} us/op "
+              f"({100 * (ratio - 1):+6.1f}%){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Pixel Gladiators' simulation and rendering.")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per benchmark")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the work in each run")
+    parser.add_argument("--out", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="baseline JSON to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--first-frame", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.first_frame:
+        first_frame()
+        return
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "video_driver": os.environ["SDL_VIDEODRIVER"],
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run_benchmarks(args.names, args.repeat, args.scale),
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report["results"], baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from ai import PlannerPolicy
+from sim import INPUT_UP, INPUT_LEFT, INPUT_RIGHT, INPUT_ATTACK
+
+# Scripted input policies for headless matches. A policy is built with its own
+# random.Random and returns one sim input bitmask per tick from act(). A
+# policy with plans set is also given the match's simulation, whose rules it
+# looks ahead with.
+
+
+class IdlePolicy:
+    def __init__(self, rng):
+        self.rng = rng
+
+    def act(self, state, index):
+        return 0
+
+
+class RandomPolicy:
+    # Mashes random inputs, holding each combination for a few ticks
+    def __init__(self, rng):
+        self.rng = rng
+        self.bits = 0
+        self.hold = 0
+
+    def act(self, state, index):
+        if self.hold <= 0:
+            self.bits = self.rng.randrange(32)
+            self.hold = self.rng.randint(5, 30)
+        self.hold -= 1
+        return self.bits
+
+
+class ChaserPolicy:
+    # Walks at the opponent and swings once in reach
+    jump_chance = 0.01
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def act(self, state, index):
+        me = state.fighters[index]
+        them = state.fighters[1 - index]
+        dx = them.x - me.x
+        dy = them.y - me.y
+
+        bits = 0
+        if dx > 10:
+            bits |= INPUT_RIGHT
+        elif dx < -10:
+            bits |= INPUT_LEFT
+        # The sword reaches anything within 30 px across and 45 px up or down
+        if abs(dx) < 30 and abs(dy) < 45:
+            bits |= INPUT_ATTACK
+        if dy < -45 or self.rng.random() < self.jump_chance:
+            bits |= INPUT_UP
+        return bits
+
+
+class JumperPolicy(ChaserPolicy):
+    # Chases like ChaserPolicy but hops constantly
+    jump_chance = 0.5
+
+
+POLICIES = {
+    "idle": IdlePolicy,
+    "random": RandomPolicy,
+    "chaser": ChaserPolicy,
+    "jumper": JumperPolicy,
+    "planner": PlannerPolicy,
+}
+
+
+def make_policy(name, rng, sim=None):
+    try:
+        policy = POLICIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown policy {name!r}, expected one of: {', '.join(sorted(POLICIES))}") from None
+    return policy(rng, sim) if getattr(policy, "plans", False) else policy(rng)
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+
+from bots import POLICIES, make_policy
+from replay import Replay, ReplayPlayer
+from sim import Simulation, TICK_RATE
+
+# Spectator broadcast: one headless server runs the match and streams its
+# state to any number of viewers.
+#
+# Every send is a delta against the last state the viewer acknowledged: a
+# bitmask of the fields that changed plus their new values, or the full state
+# when the viewer has acknowledged nothing recent. Viewers sharing a baseline
+# share one encoded message, so most of the per-viewer cost is the socket
+# write. A viewer whose socket backs up is skipped until it drains; since
+# deltas are always against acknowledged state, skipping never corrupts it.
+#
+#   python broadcast.py serve --port 7780 [--replay match.pgr]
+#   python pg.py --spectate localhost:7780
+#   python broadcast.py loadtest --clients 300 --seconds 10
+#
+# Wire format, server to viewer: a u16 length, then a message. The first is
+# MSG_HELLO with a JSON body (names, tick rate), then MSG_STATE messages.
+# Viewer to server: the u32 sequence number of each state it received.
+
+MSG_HELLO = 0
+MSG_STATE = 1
+
+SEND_RATE = 60  # State messages per second
+HISTORY_SECONDS = 2  # How far back a viewer's acknowledged state can be used
+HIGH_WATER = 64 * 1024  # Skip a viewer with this much unsent data queued
+RESTART_SECONDS = 3  # Pause on the result before the next match starts
+NO_BASELINE = 0xFFFFFFFF
+
+STATE_FIELDS = ("x", "y", "velocity_y", "health", "attacking", "jumping")  # Sent for each fighter
+LENGTH = struct.Struct("<H")
+STATE_HEADER = struct.Struct("<BIIIBH")  # type, seq, baseline seq, tick, winner (0 for none), changed mask
+ACK = struct.Struct("<I")
+
+
+def state_values(state):
+    return tuple(float(getattr(fighter, name)) for fighter in state.fighters for name in STATE_FIELDS)
+
+
+def encode_state(seq, tick, winner, values, baseline_seq=NO_BASELINE, baseline=None):
+    mask = 0
+    changed = []
+    for i, value in enumerate(values):
+        if baseline is None or baseline[i] != value:
+            mask |= 1 << i
+            changed.append(value)
+    payload = STATE_HEADER.pack(MSG_STATE, seq, baseline_seq, tick, winner or 0, mask)
+    payload += struct.pack(f"<{len(changed)}f", *changed)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def encode_hello(info):
+    payload = bytes([MSG_HELLO]) + json.dumps(info).encode()
+    return LENGTH.pack(len(payload)) + payload
+
+
+class StateDecoder:
+    # The viewer side of the delta encoding
+    def __init__(self):
+        self.history = {}  # seq -> values, for baselines the server may use
+        self.order = deque()
+        self.info = None
+        self.seq = None
+        self.tick = 0
+        self.winner = None
+        self.values = None
+
+    def decode(self, payload):
+        # Returns the acknowledgement to send back, or None
+        if payload[0] == MSG_HELLO:
+            self.info = json.loads(payload[1:])
+            return None
+        _, seq, baseline_seq, tick, winner, mask = STATE_HEADER.unpack_from(payload)
+        if baseline_seq == NO_BASELINE:
+            values = [0.0] * (len(STATE_FIELDS) * 2)
+        else:
+            values = list(self.history[baseline_seq])
+        changed = struct.unpack_from(f"<{bin(mask).count('1')}f", payload, STATE_HEADER.size)
+        j = 0
+        for i in range(len(values)):
+            if mask & (1 << i):
+                values[i] = changed[j]
+                j += 1
+
+        self.seq, self.tick, self.winner, self.values = seq, tick, winner or None, values
+        self.history[seq] = values
+        self.order.append(seq)
+        while len(self.order) > HISTORY_SECONDS * SEND_RATE + 1:
+            del self.history[self.order.popleft()]
+        return ACK.pack(seq)
+
+
+class Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.acked = None
+
+
+class BroadcastServer:
+    def __init__(self, replay=None, policy1="chaser", policy2="chaser", seed=0, tick_rate=TICK_RATE,
+                 send_rate=SEND_RATE):
+        self.replay = replay
+        self.policies = (policy1, policy2)
+        self.rng = random.Random(seed)
+        self.tick_rate = replay.tick_rate if replay else tick_rate
+        self.ticks_per_send = max(self.tick_rate // send_rate, 1)
+        self.names = replay.names if replay else [f"{policy1} bot", f"{policy2} bot"]
+        self.viewers = set()
+        # CPU and wall time spent with at least one viewer connected, which
+        # leaves out start-up and idle ticking before anyone joins
+        self.window_start = None  # (process time, wall time) the current window began at
+        self.serving_cpu = 0.0
+        self.serving_seconds = 0.0
+        self.seq = 0
+        self.history = {}  # seq -> values sent
+        self.order = deque()
+        self.ticks = 0  # Server ticks, running on across matches
+        self.bytes_sent = 0
+        self.sends = 0
+        self.skipped = 0
+        self.new_match()
+
+    def new_match(self):
+        if self.replay:
+            self.driver = ReplayPlayer(self.replay)
+            self.bots = None
+        else:
+            self.driver = Simulation(tick_rate=self.tick_rate)
+            self.bots = [make_policy(name, random.Random(self.rng.getrandbits(64)), self.driver) for name in self.policies]
+        self.ended_at = None  # Server tick the match ended on
+
+    def step(self):
+        state = self.driver.state
+        if self.bots:
+            state = self.driver.step((self.bots[0].act(state, 0), self.bots[1].act(state, 1)))
+        else:
+            state = self.driver.step()
+        self.ticks += 1
+        ended = state.winner is not None or (self.replay and self.driver.finished)
+        if ended and self.ended_at is None:
+            self.ended_at = self.ticks
+        return state
+
+    async def handle_viewer(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        viewer = Viewer(writer)
+        writer.write(encode_hello({"names": self.names, "tick_rate": self.tick_rate, "send_rate": SEND_RATE}))
+        if not self.viewers:
+            self.window_start = (time.process_time(), time.perf_counter())
+        self.viewers.add(viewer)
+        try:
+            while True:
+                (seq,) = ACK.unpack(await reader.readexactly(ACK.size))
+                if viewer.acked is None or seq > viewer.acked:
+                    viewer.acked = seq
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # Gone, or the server is shutting down
+        finally:
+            self.viewers.discard(viewer)
+            if not self.viewers:
+                self.close_window()
+            writer.close()
+
+    def close_window(self):
+        if self.window_start is not None:
+            cpu, wall = self.window_start
+            self.serving_cpu += time.process_time() - cpu
+            self.serving_seconds += time.perf_counter() - wall
+            self.window_start = None
+
+    def broadcast(self, state):
+        self.seq += 1
+        values = state_values(state)
+        self.history[self.seq] = values
+        self.order.append(self.seq)
+        while len(self.order) > HISTORY_SECONDS * SEND_RATE:
+            del self.history[self.order.popleft()]
+
+        encoded = {}  # Baseline seq -> message, shared by viewers on that baseline
+        for viewer in self.viewers:
+            transport = viewer.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > HIGH_WATER:
+                self.skipped += 1
+                continue
+            baseline_seq = viewer.acked if viewer.acked in self.history else NO_BASELINE
+            message = encoded.get(baseline_seq)
+            if message is None:
+                message = encoded[baseline_seq] = encode_state(
+                    self.seq, state.tick, state.winner, values, baseline_seq, self.history.get(baseline_seq))
+            viewer.writer.write(message)
+            self.bytes_sent += len(message)
+            self.sends += 1
+
+    async def run(self, seconds=None):
+        loop = asyncio.get_running_loop()
+        start = next_tick = loop.time()
+        while seconds is None or loop.time() - start < seconds:
+            state = self.step()
+            if self.ticks % self.ticks_per_send == 0:
+                self.broadcast(state)
+            if self.ended_at is not None and self.ticks - self.ended_at >= RESTART_SECONDS * self.tick_rate:
+                self.new_match()
+            next_tick += 1 / self.tick_rate
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+
+    def stats(self):
+        if self.viewers:
+            self.close_window()
+            self.window_start = (time.process_time(), time.perf_counter())
+        return {"viewers": len(self.viewers), "sends": self.sends, "skipped": self.skipped,
+                "bytes_sent": self.bytes_sent, "serving_cpu_seconds": self.serving_cpu,
+                "serving_seconds": self.serving_seconds}
+
+
+async def serve(args):
+    replay = Replay.load(args.replay) if args.replay else None
+    server = BroadcastServer(replay, args.policy1, args.policy2, args.seed)
+    listener = await asyncio.start_server(server.handle_viewer, args.host, args.port)
+    print(f"Broadcasting on {args.host}:{args.port}", file=sys.stderr)
+    async with listener:
+        await server.run(args.seconds)
+    print(json.dumps(server.stats()), flush=True)
+
+
+class SpectatorFeed:
+    # Stands in for the simulation's step() in pg.py, copying the broadcast
+    # state into a local simulation the sprites draw
+    def __init__(self, host, port, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.decoder = StateDecoder()
+        self.buffer = b""
+        self.sim = None
+        # The socket still blocks, up to timeout, until the hello arrives
+        while self.decoder.info is None:
+            self.receive()
+        self.sock.setblocking(False)
+        self.names = self.decoder.info["names"]
+        self.tick_rate = self.decoder.info["tick_rate"]
+
+    @property
+    def state(self):
+        return self.sim.state
+
+    def receive(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return False
+        if not data:
+            raise ConnectionError("Broadcast server closed the connection")
+        self.buffer += data
+        acks = []
+        while len(self.buffer) >= LENGTH.size:
+            (size,) = LENGTH.unpack_from(self.buffer)
+            if len(self.buffer) < LENGTH.size + size:
+                break
+            ack = self.decoder.decode(self.buffer[LENGTH.size:LENGTH.size + size])
+            self.buffer = self.buffer[LENGTH.size + size:]
+            if ack:
+                acks.append(ack)
+        if acks:
+            self.sock.sendall(acks[-1])  # The newest is all the server uses
+        return True
+
+    def close(self):
+        self.sock.close()
+
+    def step(self, inputs=None):
+        # inputs is ignored; the server decides
+        while self.receive():
+            pass
+        state = self.sim.state
+        decoder = self.decoder
+        if decoder.values is not None:
+            fields = len(STATE_FIELDS)
+            for i, fighter in enumerate(state.fighters):
+                for name, value in zip(STATE_FIELDS, decoder.values[i * fields:(i + 1) * fields]):
+                    setattr(fighter, name, bool(value) if name in ("attacking", "jumping") else value)
+                fighter.prev_x, fighter.prev_y = fighter.x, fighter.y
+            state.tick = decoder.tick
+            state.winner = decoder.winner
+        return state
+
+
+async def load_client(host, port, seconds, totals, slow):
+    reader, writer = await asyncio.open_connection(host, port)
+    decoder = StateDecoder()
+    end = asyncio.get_running_loop().time() + seconds
+    try:
+        if slow:
+            # Never reads, so the server's backpressure has to deal with it
+            await asyncio.sleep(seconds)
+            return
+        while asyncio.get_running_loop().time() < end:
+            (size,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+            payload = await reader.readexactly(size)
+            totals["bytes"] += LENGTH.size + size
+            totals["messages"] += 1
+            ack = decoder.decode(payload)
+            if ack:
+                writer.write(ack)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        totals["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def load_test(args):
+    # The server gets its own process so its CPU time is its own
+    seconds = args.seconds + 2
+    server = subprocess.Popen([sys.executable, __file__, "serve", "--port", str(args.port),
+                               "--seconds", str(seconds)], stdout=subprocess.PIPE)
+    await asyncio.sleep(1)
+    totals = {"bytes": 0, "messages": 0, "errors": 0}
+    clients = [load_client("127.0.0.1", args.port, args.seconds, totals, i < args.slow)
+               for i in range(args.clients)]
+    await asyncio.gather(*clients)
+    out, _ = await asyncio.get_running_loop().run_in_executor(None, server.communicate)
+    stats = json.loads(out.decode().strip().splitlines()[-1])
+
+    readers = max(args.clients - args.slow, 1)
+    print(f"{args.clients} viewers ({args.slow} not reading) for {args.seconds:g}s")
+    print(f"received {totals['bytes'] / readers / args.seconds / 1024:.2f} KiB/s and "
+          f"{totals['messages'] / readers / args.seconds:.1f} messages/s per viewer, {totals['errors']} errors")
+    print(f"server sent {stats['bytes_sent'] / max(stats['sends'], 1):.1f} bytes per message, "
+          f"skipped {stats['skipped']} sends to backed-up viewers")
+    # Only the time viewers were connected counts, shared among the viewers
+    # actually reading
+    cpu_rate = 1000 * stats["serving_cpu_seconds"] / max(stats["serving_seconds"], 1e-9)
+    print(f"server CPU {cpu_rate:.1f} ms/s while serving, {cpu_rate / readers:.3f} ms/s per reading viewer")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pixel Gladiators spectator broadcast server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run a match and stream it to viewers")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=7780)
+    serve_parser.add_argument("--replay", metavar="FILE", help="broadcast a recorded match instead of bots")
+    serve_parser.add_argument("--policy1", choices=sorted(POLICIES), default="chaser")
+    serve_parser.add_argument("--policy2", choices=sorted(POLICIES), default="jumper")
+    serve_parser.add_argument("--seed", type=int, default=0)
+    serve_parser.add_argument("--seconds", type=float, help="stop after this long and print stats")
+    load_parser = commands.add_parser("loadtest", help="measure per-viewer cost against a local server")
+    load_parser.add_argument("--clients", type=int, default=200)
+    load_parser.add_argument("--slow", type=int, default=0, help="viewers that never read")
+    load_parser.add_argument("--seconds", type=float, default=10)
+    load_parser.add_argument("--port", type=int, default=7781)
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args) if args.command == "serve" else load_test(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import json
+
+import pygame
+
+from sim import INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT, INPUT_ATTACK
+
+# Input outside the simulation: a rebindable table of what drives each
+# player's moves, read from the keyboard and any connected controllers, and a
+# per-scene registry of clickable widgets. Widgets are filed in a grid, so a
+# mouse event only tests the few widgets in its cell and a frame's UI work
+# grows with the events that arrived, not with events times widgets.
+#
+# Bindings are strings so a controls file stays readable:
+#   "space", "left shift"   a key, as pygame.key.name() spells it
+#   "pad0 button 1"         a controller button
+#   "pad0 axis 1 +"         a stick pushed past AXIS_DEAD_ZONE one way
+#   "pad0 hat 0 left"       a d-pad direction
+# padN is the Nth controller connected.
+
+ACTIONS = (("up", INPUT_UP), ("down", INPUT_DOWN), ("left", INPUT_LEFT),
+           ("right", INPUT_RIGHT), ("attack", INPUT_ATTACK))
+DEFAULT_BINDINGS = [
+    {"up": ["w", "pad0 hat 0 up", "pad0 axis 1 -"],
+     "down": ["s", "pad0 hat 0 down", "pad0 axis 1 +"],
+     "left": ["a", "pad0 hat 0 left", "pad0 axis 0 -"],
+     "right": ["d", "pad0 hat 0 right", "pad0 axis 0 +"],
+     "attack": ["space", "pad0 button 0"]},
+    {"up": ["up", "pad1 hat 0 up", "pad1 axis 1 -"],
+     "down": ["down", "pad1 hat 0 down", "pad1 axis 1 +"],
+     "left": ["left", "pad1 hat 0 left", "pad1 axis 0 -"],
+     "right": ["right", "pad1 hat 0 right", "pad1 axis 0 +"],
+     "attack": ["return", "pad1 button 0"]},
+]
+AXIS_DEAD_ZONE = 0.5
+HAT_DIRECTIONS = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+GRID_CELL = 64  # Widget index cell size in logical pixels
+
+
+def is_pad_binding(binding):
+    return binding.startswith("pad")
+
+
+def parse_binding(binding):
+    # ("key", keycode) or ("button"|"axis"|"hat", pad, index[, direction])
+    parts = binding.split()
+    if is_pad_binding(binding) and len(parts) >= 3:
+        pad, kind, index = int(parts[0][3:]), parts[1], int(parts[2])
+        if kind == "button" and len(parts) == 3:
+            return ("button", pad, index)
+        if kind == "axis" and len(parts) == 4 and parts[3] in "+-":
+            return ("axis", pad, index, 1 if parts[3] == "+" else -1)
+        if kind == "hat" and len(parts) == 4 and parts[3] in HAT_DIRECTIONS:
+            return ("hat", pad, index, HAT_DIRECTIONS[parts[3]])
+        raise ValueError(f"Bad controller binding {binding!r}")
+    return ("key", pygame.key.key_code(binding))
+
+
+class Controls:
+    def __init__(self, bindings=None):
+        # bindings: one {action: [binding, ...]} dict per player
+        self.bindings = [{action: list(found) for action, found in player.items()}
+                         for player in bindings or DEFAULT_BINDINGS]
+        self.joysticks = {}  # pad number -> pygame.joystick.Joystick
+        self.version = 0  # Bumped on every rebind, for whoever shows them
+        self.compile()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f)["players"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"players": self.bindings}, f, indent=2)
+
+    def compile(self):
+        # Parse the strings once so a read is only lookups
+        self.keys = []  # Per player: (keycode, input bit)
+        self.pads = []  # Per player: (parsed binding, input bit)
+        for player in self.bindings:
+            keys, pads = [], []
+            for action, bit in ACTIONS:
+                for binding in player.get(action, ()):
+                    parsed = parse_binding(binding)
+                    if parsed[0] == "key":
+                        keys.append((parsed[1], bit))
+                    else:
+                        pads.append((parsed, bit))
+            self.keys.append(keys)
+            self.pads.append(pads)
+
+    def read(self, keys):
+        # keys is pygame.key.get_pressed(); one sim input bitmask per player
+        inputs = []
+        for key_bits, pad_bits in zip(self.keys, self.pads):
+            bits = 0
+            for code, bit in key_bits:
+                if keys[code]:
+                    bits |= bit
+            if self.joysticks:
+                for binding, bit in pad_bits:
+                    if self.pad_pressed(binding):
+                        bits |= bit
+            inputs.append(bits)
+        return tuple(inputs)
+
+    def pad_pressed(self, binding):
+        joystick = self.joysticks.get(binding[1])
+        if joystick is None:
+            return False
+        kind, index = binding[0], binding[2]
+        if kind == "button":
+            return index < joystick.get_numbuttons() and joystick.get_button(index)
+        if kind == "axis":
+            return index < joystick.get_numaxes() and joystick.get_axis(index) * binding[3] > AXIS_DEAD_ZONE
+        if index >= joystick.get_numhats():
+            return False
+        value = joystick.get_hat(index)
+        return any(want and value[i] == want for i, want in enumerate(binding[3]))
+
+    def handle(self, event):
+        # Controllers come and go while running; SDL also reports the ones
+        # already plugged in at startup this way
+        if event.type == pygame.JOYDEVICEADDED:
+            joystick = pygame.joystick.Joystick(event.device_index)
+            pad = 0
+            while pad in self.joysticks:
+                pad += 1
+            self.joysticks[pad] = joystick
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            for pad, joystick in list(self.joysticks.items()):
+                if joystick.get_instance_id() == event.instance_id:
+                    del self.joysticks[pad]
+
+    def pad_number(self, instance_id):
+        for pad, joystick in self.joysticks.items():
+            if joystick.get_instance_id() == instance_id:
+                return pad
+        return None
+
+    def capture(self, event):
+        # The binding a key press or controller input would make, if any
+        if event.type == pygame.KEYDOWN:
+            return pygame.key.name(event.key) or None
+        if event.type not in (pygame.JOYBUTTONDOWN, pygame.JOYAXISMOTION, pygame.JOYHATMOTION):
+            return None
+        pad = self.pad_number(event.instance_id)
+        if pad is None:
+            return None
+        if event.type == pygame.JOYBUTTONDOWN:
+            return f"pad{pad} button {event.button}"
+        if event.type == pygame.JOYAXISMOTION:
+            if abs(event.value) <= AXIS_DEAD_ZONE:
+                return None
+            return f"pad{pad} axis {event.axis} {'+' if event.value > 0 else '-'}"
+        for direction, value in HAT_DIRECTIONS.items():
+            if tuple(event.value) == value:
+                return f"pad{pad} hat {event.hat} {direction}"
+        return None
+
+    def bind(self, player, action, binding):
+        # Replaces the action's bindings of the same kind (keyboard or
+        # controller) and takes the binding away from whatever had it
+        parse_binding(binding)
+        pad = is_pad_binding(binding)
+        for bindings in self.bindings:
+            for found in bindings.values():
+                if binding in found:
+                    found.remove(binding)
+        found = self.bindings[player].setdefault(action, [])
+        found[:] = [binding] + [other for other in found if is_pad_binding(other) != pad]
+        self.version += 1
+        self.compile()
+
+    def label(self, player, action):
+        # Keyboard binding first, it is what most people look for
+        found = self.bindings[player].get(action, [])
+        keys = [binding for binding in found if not is_pad_binding(binding)]
+        return (keys or found or ["-"])[0].upper()
+
+
+class WidgetIndex:
+    # Widgets need a rect and set_hovered(hovered) and click(event). A
+    # focusable widget also gets the key events while focused through
+    # key(event), which returns False once it lets go, and blur() when a
+    # click lands anywhere else
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self.cells = {}  # (column, row) -> widgets overlapping that cell
+        self.order = {}  # widget -> registration number; later ones are on top
+        self.count = 0
+        self.hovered = None
+        self.focus = None
+
+    def cells_for(self, rect):
+        for column in range(rect.left // self.cell, (rect.right - 1) // self.cell + 1):
+            for row in range(rect.top // self.cell, (rect.bottom - 1) // self.cell + 1):
+                yield column, row
+
+    def add(self, widget):
+        self.count += 1
+        self.order[widget] = self.count
+        for cell in self.cells_for(widget.rect):
+            self.cells.setdefault(cell, []).append(widget)
+
+    def remove(self, widget):
+        if self.order.pop(widget, None) is None:
+            return
+        for cell in self.cells_for(widget.rect):
+            self.cells[cell].remove(widget)
+        if self.hovered is widget:
+            self.hover(None)
+        if self.focus is widget:
+            self.focus = None
+
+    def hit(self, pos):
+        found = None
+        for widget in self.cells.get((pos[0] // self.cell, pos[1] // self.cell), ()):
+            if widget.rect.collidepoint(pos) and (found is None or self.order[widget] > self.order[found]):
+                found = widget
+        return found
+
+    def hover(self, widget):
+        if widget is not self.hovered:
+            if self.hovered is not None:
+                self.hovered.set_hovered(False)
+            if widget is not None:
+                widget.set_hovered(True)
+            self.hovered = widget
+
+    def reset(self, pos=None):
+        # Drops focus without blurring, and hovers whatever is under pos
+        self.focus = None
+        self.hover(None if pos is None else self.hit(pos))
+
+    def dispatch(self, event):
+        # True if a widget took the event
+        if event.type == pygame.MOUSEMOTION:
+            self.hover(self.hit(event.pos))
+            return self.hovered is not None
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            widget = self.hit(event.pos)
+            self.hover(widget)
+            if self.focus is not None and widget is not self.focus:
+                focus, self.focus = self.focus, None
+                focus.blur()
+            if widget is None:
+                return False
+            if getattr(widget, "focusable", False):
+                self.focus = widget
+            widget.click(event)
+            return True
+        if event.type == pygame.KEYDOWN and self.focus is not None:
+            if not self.focus.key(event):
+                self.focus = None
+            return True
+        return False
@@ -0,0 +1,348 @@
+import argparse
+import random
+import socket
+import struct
+import time
+from collections import deque
+
+from bots import make_policy, POLICIES
+from sim import Simulation, TICK_RATE
+
+# Rollback netcode for online 1v1.
+#
+# Both peers run the full simulation. Each tick the local input is sent to the
+# peer, scheduled INPUT_DELAY ticks ahead, and the peer's input for ticks it
+# has not heard about yet is predicted by repeating its last known one. When
+# the real input arrives and differs, the simulation is rolled back to a
+# snapshot of that tick and re-simulated up to the present. A peer more than
+# MAX_ROLLBACK ticks ahead of what it has heard stalls instead.
+#
+# Inputs travel over UDP, every packet carrying all of the sender's inputs the
+# peer has not acknowledged yet, so a lost packet is covered by the next one.
+#
+#   python netplay.py --latency 0.08 --jitter 0.02 --loss 0.05
+#
+# runs two bot-driven peers against each other over UDP loopback through a
+# latency/loss simulating link and reports the rollback load.
+
+INPUT_DELAY = 2  # Ticks between reading a local input and simulating it
+MAX_ROLLBACK = 16  # Most ticks the simulation runs ahead of confirmed input
+MAX_REDUNDANCY = 64  # Most inputs in one packet
+FRAME_BUDGET = 1 / 60  # Time one display frame may spend simulating
+
+PACKET_HEADER = struct.Struct("<2sHIIB")  # magic, match, ack, first frame, input count
+PACKET_MAGIC = b"PG"
+
+
+class RollbackSession:
+    def __init__(self, sim, local_index, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK, keep_settled=False):
+        self.sim = sim
+        self.local_index = local_index
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.frame = sim.state.tick  # Next frame to simulate
+        self.local_inputs = {}
+        self.remote_inputs = {}
+        self.predicted = {}  # Remote input each simulated frame assumed
+        self.snapshots = {}  # State before each frame that may be rolled back
+        self.confirmed_frame = self.frame + input_delay - 1  # Remote inputs known up to here
+        self.acked_frame = self.frame - 1  # Local inputs the peer has confirmed
+        self.mismatch_frame = None  # Earliest frame simulated with a wrong guess
+        # With keep_settled, snapshots of the ticks no late input can change
+        # any more, oldest first, for whoever logs the match to take
+        self.settled = deque() if keep_settled else None
+        self.settled_tick = self.frame  # Last tick put in settled
+        for frame in range(self.frame, self.frame + input_delay):
+            self.local_inputs[frame] = 0
+            self.remote_inputs[frame] = 0
+
+        self.rollback_frames = 0  # Frames re-simulated by the last advance()
+        self.total_rollback_frames = 0
+        self.stalls = 0
+
+    def add_local_input(self, bits):
+        frame = self.frame + self.input_delay
+        self.local_inputs.setdefault(frame, bits)
+        return frame
+
+    def add_remote_input(self, frame, bits):
+        if frame in self.remote_inputs or frame <= self.confirmed_frame:
+            return
+        self.remote_inputs[frame] = bits
+        while self.confirmed_frame + 1 in self.remote_inputs:
+            self.confirmed_frame += 1
+        if frame < self.frame and self.predicted.get(frame) != bits:
+            if self.mismatch_frame is None or frame < self.mismatch_frame:
+                self.mismatch_frame = frame
+
+    def predict(self, frame):
+        bits = self.remote_inputs.get(frame)
+        if bits is None:
+            bits = self.remote_inputs[self.confirmed_frame]
+        return bits
+
+    def simulate(self, frame):
+        self.snapshots[frame] = self.sim.snapshot()
+        remote = self.predicted[frame] = self.predict(frame)
+        local = self.local_inputs[frame]
+        self.sim.step((local, remote) if self.local_index == 0 else (remote, local))
+
+    def rollback(self):
+        # Re-simulates from the earliest mispredicted frame, if any
+        self.rollback_frames = 0
+        if self.mismatch_frame is not None:
+            self.sim.restore(self.snapshots[self.mismatch_frame])
+            for frame in range(self.mismatch_frame, self.frame):
+                self.simulate(frame)
+            self.rollback_frames = self.frame - self.mismatch_frame
+            self.total_rollback_frames += self.rollback_frames
+            self.mismatch_frame = None
+
+    def advance(self):
+        # Runs any needed rollback, then one new frame. False when stalled
+        self.rollback()
+        if self.frame - self.confirmed_frame > self.max_rollback or self.frame not in self.local_inputs:
+            self.stalls += 1
+            return False
+        self.simulate(self.frame)
+        self.frame += 1
+
+        # The state before a frame is final once every earlier frame's input
+        # is known; take it before its snapshot is dropped below
+        if self.settled is not None:
+            while self.settled_tick < min(self.confirmed_frame + 1, self.frame - 1):
+                self.settled_tick += 1
+                self.settled.append(self.snapshots[self.settled_tick])
+
+        # Frames at or before the confirmed one can never be rolled back, and
+        # local inputs are kept until the peer has them
+        oldest = min(self.confirmed_frame, self.frame - self.max_rollback - 1)
+        for table, before in ((self.snapshots, oldest), (self.predicted, oldest), (self.remote_inputs, oldest),
+                              (self.local_inputs, min(oldest, self.acked_frame + 1))):
+            for frame in [frame for frame in table if frame < before]:
+                del table[frame]
+        return True
+
+
+class UdpTransport:
+    def __init__(self, session, sock, peer_addr=None, match=0, send=None):
+        self.session = session
+        self.sock = sock
+        self.peer_addr = peer_addr  # A host learns it from the first packet
+        self.match = match  # Packets from an earlier match are ignored
+        self.sendto = send or sock.sendto
+
+    def send(self):
+        if self.peer_addr is None:
+            return
+        # Everything not acknowledged yet, oldest first so the peer can always
+        # confirm further
+        session = self.session
+        first = session.acked_frame + 1
+        last = min(session.frame + session.input_delay, first + MAX_REDUNDANCY - 1)
+        inputs = bytes(session.local_inputs[frame] for frame in range(first, last + 1)
+                       if frame in session.local_inputs)
+        header = PACKET_HEADER.pack(PACKET_MAGIC, self.match, session.confirmed_frame, first, len(inputs))
+        self.sendto(header + inputs, self.peer_addr)
+
+    def poll(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                continue  # ICMP unreachable on some platforms, the peer is not up yet
+            if len(data) < PACKET_HEADER.size:
+                continue
+            magic, match, ack, first, count = PACKET_HEADER.unpack_from(data)
+            if magic != PACKET_MAGIC or match != self.match:
+                continue
+            if self.peer_addr is None:
+                self.peer_addr = addr
+            self.session.acked_frame = max(self.session.acked_frame, ack)
+            for i, bits in enumerate(data[PACKET_HEADER.size:PACKET_HEADER.size + count]):
+                self.session.add_remote_input(first + i, bits)
+
+
+def open_socket(port=0, host="0.0.0.0"):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    return sock
+
+
+class NetplayDriver:
+    # Stands in for the simulation's step() during an online match
+    def __init__(self, sim, local_index, sock, peer_addr=None, match=0, keep_settled=False):
+        self.sim = sim
+        self.local_index = local_index
+        self.session = RollbackSession(sim, local_index, keep_settled=keep_settled)
+        self.transport = UdpTransport(self.session, sock, peer_addr, match)
+
+    @property
+    def state(self):
+        return self.sim.state
+
+    @property
+    def settled(self):
+        # Snapshots of final ticks, with keep_settled; None without
+        return self.session.settled
+
+    @property
+    def confirmed(self):
+        # Whether the current state only depends on inputs actually received
+        return self.sim.state.tick <= self.session.confirmed_frame + 1
+
+    def step(self, inputs):
+        # Only this side's input is used; the peer supplies the other
+        self.transport.poll()
+        self.session.add_local_input(inputs[self.local_index])
+        self.session.advance()
+        self.transport.send()
+        return self.sim.state
+
+
+class LinkConditioner:
+    # Delays, jitters and drops outgoing packets to mimic a real connection
+    def __init__(self, sock, latency, jitter, loss, rng, clock):
+        self.sock = sock
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.clock = clock
+        self.queue = deque()
+        self.sent = 0
+        self.dropped = 0
+
+    def sendto(self, data, addr):
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0)
+        self.queue.append((self.clock() + delay, data, addr))
+
+    def pump(self):
+        # Jitter can reorder packets, as it would on the wire
+        now = self.clock()
+        pending = deque()
+        while self.queue:
+            due, data, addr = self.queue.popleft()
+            if due <= now:
+                self.sock.sendto(data, addr)
+            else:
+                pending.append((due, data, addr))
+        self.queue = pending
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+
+def run_loopback(seconds, latency, jitter, loss, tick_rate=TICK_RATE, policy1="chaser", policy2="jumper",
+                 seed=0, max_rollback=MAX_ROLLBACK):
+    rng = random.Random(seed)
+    clock_time = [0.0]  # Simulated wall clock, so the test runs as fast as it can
+
+    def clock():
+        return clock_time[0]
+
+    socks = [open_socket(0, "127.0.0.1"), open_socket(0, "127.0.0.1")]
+    addrs = [sock.getsockname() for sock in socks]
+    peers = []
+    for index in (0, 1):
+        sim = Simulation(tick_rate=tick_rate)
+        session = RollbackSession(sim, index, max_rollback=max_rollback)
+        link = LinkConditioner(socks[index], latency, jitter, loss, random.Random(rng.random()), clock)
+        transport = UdpTransport(session, socks[index], addrs[1 - index], send=link.sendto)
+        bot = make_policy(policy1 if index == 0 else policy2, random.Random(rng.random()), sim)
+        peers.append((sim, session, transport, link, bot))
+
+    tick_times = []
+    rollbacks = []
+    ticks = int(seconds * tick_rate)
+    for tick in range(ticks):
+        clock_time[0] = tick / tick_rate
+        for sim, session, transport, link, bot in peers:
+            link.pump()
+        for sim, session, transport, link, bot in peers:
+            start = time.perf_counter()
+            transport.poll()
+            session.add_local_input(bot.act(sim.state, session.local_index))
+            session.advance()
+            transport.send()
+            tick_times.append(time.perf_counter() - start)
+            rollbacks.append(session.rollback_frames)
+
+    # Bring both sides to the same frame on idle input and let the last
+    # packets land, so every simulated frame is confirmed on both
+    target = max(session.frame for _, session, _, _, _ in peers)
+    for _ in range(int(4 * (latency + jitter + 0.1) * tick_rate) + 2 * max_rollback):
+        clock_time[0] += 1 / tick_rate
+        for sim, session, transport, link, bot in peers:
+            link.pump()
+        for sim, session, transport, link, bot in peers:
+            transport.poll()
+            if session.frame < target:
+                session.add_local_input(0)
+                session.advance()
+            else:
+                session.rollback()
+            transport.send()
+
+    # Cost of one re-simulated frame, to size the rollback window to a budget
+    sim = peers[0][0]
+    snapshot = sim.snapshot()
+    start = time.perf_counter()
+    for _ in range(2000):
+        sim.restore(snapshot)
+        sim.step((0, 0))
+    frame_cost = (time.perf_counter() - start) / 2000
+    sim.restore(snapshot)
+
+    for sock in socks:
+        sock.close()
+
+    (sim1, session1, _, link1, _), (sim2, session2, _, link2, _) = peers
+    settled = session1.frame == session2.frame == target and min(
+        session1.confirmed_frame, session2.confirmed_frame) >= target - 1
+    return {
+        "ticks": ticks,
+        "frames": [session1.frame, session2.frame],
+        "stalls": [session1.stalls, session2.stalls],
+        "packets_sent": link1.sent + link2.sent,
+        "packets_dropped": link1.dropped + link2.dropped,
+        "rollback_frames_mean": sum(rollbacks) / len(rollbacks),
+        "rollback_frames_p99": percentile(rollbacks, 0.99),
+        "rollback_frames_max": max(rollbacks),
+        "tick_ms_mean": 1000 * sum(tick_times) / len(tick_times),
+        "tick_ms_max": 1000 * max(tick_times),
+        "resim_frame_us": 1e6 * frame_cost,
+        "rollback_frames_in_budget": int(FRAME_BUDGET / frame_cost),
+        "in_sync": sim1.state_hash() == sim2.state_hash() if settled else None,  # None: could not settle
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rollback netcode loopback test harness.")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--latency", type=float, default=0.05, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="+/- seconds added to the delay")
+    parser.add_argument("--loss", type=float, default=0.02, help="fraction of packets dropped")
+    parser.add_argument("--max-rollback", type=int, default=MAX_ROLLBACK)
+    parser.add_argument("--policy1", choices=sorted(POLICIES), default="chaser")
+    parser.add_argument("--policy2", choices=sorted(POLICIES), default="jumper")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = run_loopback(args.seconds, args.latency, args.jitter, args.loss, policy1=args.policy1,
+                          policy2=args.policy2, seed=args.seed, max_rollback=args.max_rollback)
+    for key, value in report.items():
+        print(f"{key:28} {value:.3f}" if isinstance(value, float) else f"{key:28} {value}")
+
+
+if __name__ == "__main__":
+    main()
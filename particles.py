@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+import pygame
+
+# Hit sparks, landing dust and knockout bursts.
+#
+# Particles live in a ParticlePool as parallel NumPy columns of a fixed
+# capacity, allocated once. Emitting writes a batch of rows at a ring-buffer
+# head, overwriting the oldest particles when the pool is full; a frame's
+# update is a handful of in-place whole-array operations, and drawing blends
+# every live particle into the target surface through one view of its pixels.
+# Nothing is allocated per particle, and an empty pool costs nothing at all.
+
+CAPACITY = 32768
+PARTICLE_SIZE = 2  # Square side in pixels
+
+# Emitter presets: count, speed range (px/s), spread (radians around the
+# direction), lifetime range (s), gravity (px/s^2) and colors to pick from
+HIT_SPARKS = dict(count=16, speed=(80, 260), spread=math.pi, life=(0.15, 0.4), gravity=600,
+                  colors=((255, 255, 255), (255, 230, 120), (255, 160, 40)))
+LANDING_DUST = dict(count=24, speed=(20, 90), spread=0.6, life=(0.25, 0.6), gravity=120,
+                    colors=((170, 160, 150), (130, 120, 110), (200, 195, 185)))
+KO_BURST = dict(count=3000, speed=(40, 520), spread=math.pi, life=(0.5, 1.4), gravity=250,
+                colors=((255, 255, 255), (255, 230, 120)))
+
+
+class ParticlePool:
+    FLOAT_COLUMNS = ("x", "y", "velocity_x", "velocity_y", "age", "life", "gravity")
+
+    def __init__(self, capacity=CAPACITY, seed=None):
+        self.capacity = capacity
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float32))
+        self.color = np.zeros((capacity, 3), dtype=np.float32)
+        self.scratch = np.zeros(capacity, dtype=np.float32)
+        self.head = 0  # Next row to write
+        self.used = 0  # Rows written at least once
+        self.time_left = 0.0  # Until the longest-lived particle dies
+        self.rng = np.random.default_rng(seed)
+
+    def clear(self):
+        self.life[:] = 0
+        self.time_left = 0.0
+
+    @property
+    def active(self):
+        return self.time_left > 0
+
+    def emit(self, x, y, count, speed, spread, life, gravity, colors, direction=-math.pi / 2, tint=None):
+        # Sprays count particles from (x, y) around direction (default up)
+        count = min(count, self.capacity)
+        start = self.head
+        rows = (start + np.arange(count)) % self.capacity
+        self.head = (start + count) % self.capacity
+        self.used = min(self.capacity, max(self.used, start + count))
+
+        rng = self.rng
+        angle = direction + rng.uniform(-spread, spread, count)
+        magnitude = rng.uniform(*speed, count)
+        self.x[rows] = x
+        self.y[rows] = y
+        self.velocity_x[rows] = np.cos(angle) * magnitude
+        self.velocity_y[rows] = np.sin(angle) * magnitude
+        self.age[rows] = 0
+        self.life[rows] = rng.uniform(*life, count)
+        self.gravity[rows] = gravity
+        palette = np.array(colors + ((tint,) if tint is not None else ()), dtype=np.float32)
+        self.color[rows] = palette[rng.integers(len(palette), size=count)]
+        self.time_left = max(self.time_left, life[1])
+
+    def update(self, dt):
+        if not self.active:
+            return
+        self.time_left -= dt
+        n = self.used
+        scratch = self.scratch[:n]
+        np.multiply(self.gravity[:n], dt, out=scratch)
+        self.velocity_y[:n] += scratch
+        np.multiply(self.velocity_x[:n], dt, out=scratch)
+        self.x[:n] += scratch
+        np.multiply(self.velocity_y[:n], dt, out=scratch)
+        self.y[:n] += scratch
+        self.age[:n] += dt
+
+    def draw(self, surface):
+        # Blends live particles over the surface, fading with age. Returns
+        # the rect drawn over, or None. Only 32-bit surfaces with 8-bit
+        # channels at bits 0, 8 and 16 (the display format everywhere in
+        # practice) are drawn to, which lets red and blue blend in one multiply
+        if not self.active or surface.get_bytesize() != 4 or sorted(surface.get_shifts()[:3]) != [0, 8, 16]:
+            return None
+        n = self.used
+        width, height = surface.get_size()
+        x, y = self.x[:n], self.y[:n]
+        live = np.flatnonzero((self.age[:n] < self.life[:n]) & (x >= 0) & (x < width - PARTICLE_SIZE)
+                              & (y >= 0) & (y < height - PARTICLE_SIZE))
+        if not len(live):
+            return None
+        xs = x[live].astype(np.int32)
+        ys = y[live].astype(np.int32)
+
+        # Every pixel of every particle as an index into the flat pixel
+        # buffer, one row per particle
+        stride = surface.get_pitch() // 4
+        offsets = np.array([dy * stride + dx for dy in range(PARTICLE_SIZE) for dx in range(PARTICLE_SIZE)],
+                           dtype=np.int32)
+        index = (ys * stride + xs)[:, None] + offsets
+
+        # Each particle's color in the surface's layout, premultiplied by its
+        # opacity out of 256
+        alpha = ((1 - self.age[live] / self.life[live]) * 256).astype(np.uint32)
+        color = np.zeros(len(live), dtype=np.uint32)
+        for channel, shift in enumerate(surface.get_shifts()[:3]):
+            color |= self.color[live, channel].astype(np.uint32) << shift
+        red_blue = ((color & 0xFF00FF) * alpha)[:, None]
+        green = ((color & 0x00FF00) * alpha)[:, None]
+        keep = (256 - alpha)[:, None]
+
+        buffer = surface.get_buffer()
+        pixels = np.frombuffer(buffer, dtype=np.uint32)
+        below = pixels[index]
+        pixels[index] = ((((below & 0xFF00FF) * keep + red_blue) >> 8) & 0xFF00FF
+                         | (((below & 0x00FF00) * keep + green) >> 8) & 0x00FF00)
+        del pixels, buffer  # Unlocks the surface
+
+        left, top = int(xs.min()), int(ys.min())
+        return pygame.Rect(left, top, int(xs.max()) - left + PARTICLE_SIZE, int(ys.max()) - top + PARTICLE_SIZE)
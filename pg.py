@@ -1,15 +1,30 @@
 import pygame
+import argparse
+import math
 import sys
 import os
-
-# Initialize pygame testing
-pygame.init()
-
-# Screen settings
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Pixel Gladiators")
+import random
+import time
+
+from sim import (Simulation, FixedTimestep, TICK_RATE, ARENA_WIDTH, ARENA_HEIGHT,
+                 PLAYER_WIDTH, PLAYER_HEIGHT, SWORD_IDLE_POS)
+from textcache import TextCache
+from assets import AssetManager
+from replay import Replay, ReplayPlayer, ReplayRecorder
+from profiler import Profiler, ProfilerHud
+from controls import ACTIONS, Controls, WidgetIndex
+from skins import ANIMATION_MS, DEFAULT_SKIN, SWING_MS, get_atlas, next_skin
+from particles import HIT_SPARKS, KO_BURST, LANDING_DUST, ParticlePool
+from ai import DIFFICULTIES, PlannerPolicy
+
+# Screen settings. Everything is drawn to a fixed logical screen, which is
+# scaled once to whatever the window or monitor actually is
+SCREEN_WIDTH = ARENA_WIDTH
+SCREEN_HEIGHT = ARENA_HEIGHT
+screen = None  # Logical screen all drawing goes to
+window = None  # Real display surface
+viewport = None  # Where the logical screen lands in the window when scaled in software
+window_view = None  # Subsurface of the window covering the viewport
 
 # Colors
 WHITE = (255, 255, 255)
@@ -17,46 +32,55 @@ RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
 
-# Load background images
-try:
-    GAME_BACKGROUND = pygame.image.load(os.path.join(os.path.dirname(__file__), "pg-background.jpg"))
-    GAME_BACKGROUND = pygame.transform.scale(GAME_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
-
-    LOBBY_BACKGROUND = pygame.image.load(os.path.join(os.path.dirname(__file__), "menu-page-bg.jpg"))
-    LOBBY_BACKGROUND = pygame.transform.scale(LOBBY_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
-
-    MENU_BACKGROUND = pygame.image.load(os.path.join(os.path.dirname(__file__), "lobby.jpg"))
-    MENU_BACKGROUND = pygame.transform.scale(MENU_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
+# Background images and fonts, loaded by load_assets() the first time a
+# scene needs them
+ASSETS = AssetManager()
+GAME_BACKGROUND = None
+LOBBY_BACKGROUND = None
+MENU_BACKGROUND = None
+MENU_OVERLAY = None
 
-    MENU_OVERLAY = pygame.image.load(os.path.join(os.path.dirname(__file__), "menu-bg.png"))
-    MENU_OVERLAY = pygame.transform.scale(MENU_OVERLAY, (SCREEN_WIDTH/1.5, SCREEN_HEIGHT))
-except pygame.error as e:
-    raise FileNotFoundError(f"Background image not found. Please ensure all image files are in the same directory as the script. Error: {e}")
-
-# Font settings
 FONT_PATH = os.path.join(os.path.dirname(__file__), "Minercraftory.ttf")
-if not os.path.exists(FONT_PATH):
-    raise FileNotFoundError(f"Font file not found at {FONT_PATH}. Please ensure the file is in the same directory as the script.")
-FONT = pygame.font.Font(FONT_PATH, 24)
-TITLE_FONT = pygame.font.Font(FONT_PATH, 64)
-SUBTITLE_FONT = pygame.font.Font(FONT_PATH, 38)
-BUTTON_FONT = pygame.font.Font(FONT_PATH, 20)  # Smaller font for button text
+FONT = None
+TITLE_FONT = None
+SUBTITLE_FONT = None
+BUTTON_FONT = None
+CUSTOMIZE_FONT = None
+FONTS = {}  # One pygame.font.Font per point size
+
+# Backgrounds only ever exist at the logical screen size
+BACKGROUNDS = {
+    "GAME_BACKGROUND": ("pg-background.jpg", (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    "LOBBY_BACKGROUND": ("menu-page-bg.jpg", (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    "MENU_BACKGROUND": ("lobby.jpg", (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    "MENU_OVERLAY": ("menu-bg.png", (SCREEN_WIDTH/1.5, SCREEN_HEIGHT)),
+}
+FONT_SIZES = {
+    "FONT": 24,
+    "TITLE_FONT": 64,
+    "SUBTITLE_FONT": 38,
+    "BUTTON_FONT": 20,  # Smaller font for button text
+    "CUSTOMIZE_FONT": 48,  # Smaller font for customize screen title
+}
+TEXT_CACHE = TextCache()
+
+# Stage timers and counters, shown with F3. Costs next to nothing until enabled
+PROFILER = Profiler()
 
 # Clock
-clock = pygame.time.Clock()
-FPS = 60
+FPS = 60  # Display rate; the simulation runs at its own TICK_RATE
+
+# Outside of a match nothing moves by itself, so those screens sleep until
+# input arrives or the next animation step is due
+IDLE_TIMEOUT_MS = 1000  # Longest an idle screen sleeps
+CURSOR_BLINK_MS = 500  # Name input cursor on/off period
 
-# Player settings
-PLAYER_WIDTH = 50
-PLAYER_HEIGHT = 50
-PLAYER_SPEED = 5
-GRAVITY = 0.8
-JUMP_SPEED = -15
+# How long the knockout burst plays before the game over screen
+KO_SECONDS = 1.2
 
-# Sword settings
-SWORD_WIDTH = 10
-SWORD_HEIGHT = 40
-SWORD_DAMAGE = 5  # Damage inflicted by a sword hit
+# Push only the regions that changed to the display instead of flipping the
+# whole screen every frame
+DIRTY_RENDERING = True
 
 # Add to the constants at the top
 FULLSCREEN = False  # Initial fullscreen state
@@ -64,352 +88,658 @@ FULLSCREEN = False  # Initial fullscreen state
 # Add to the constants section
 DEFAULT_PLAYER1_NAME = "Player 1"
 DEFAULT_PLAYER2_NAME = "Player 2"
-CUSTOMIZE_FONT = pygame.font.Font(FONT_PATH, 48)  # Smaller font for customize screen title
 
-# Player class
-class Player(pygame.sprite.Sprite):
-    def __init__(self, x, y, color):
+def init_display():
+    # Importing this module has no side effects; the window, images and fonts
+    # are only created here so the simulation can run without a display.
+    # Only the menu's assets are loaded before the first frame, the other
+    # backgrounds decode on worker threads meanwhile
+    pygame.init()
+    set_display_mode(FULLSCREEN)
+    pygame.display.set_caption("Pixel Gladiators")
+
+    if not os.path.exists(FONT_PATH):
+        raise FileNotFoundError(f"Font file not found at {FONT_PATH}. Please ensure the file is in the same directory as the script.")
+    load_assets(MenuScene.assets)
+    for name, size in BACKGROUNDS.values():
+        ASSETS.preload(name, size)
+
+def set_display_mode(fullscreen):
+    global screen, window, viewport, window_view
+    flags = pygame.FULLSCREEN if fullscreen else 0
+    try:
+        # SDL scales and letterboxes the logical screen on the GPU
+        window = screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), flags | pygame.SCALED)
+        viewport = None
+        return
+    except pygame.error:
+        pass
+
+    # No accelerated renderer (e.g. the dummy video driver): scale in software
+    if fullscreen:
+        window = pygame.display.set_mode(pygame.display.get_desktop_sizes()[0], flags)
+    else:
+        window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    if window.get_size() == (SCREEN_WIDTH, SCREEN_HEIGHT):
+        screen = window
+        viewport = None
+        return
+
+    window_width, window_height = window.get_size()
+    scale = min(window_width / SCREEN_WIDTH, window_height / SCREEN_HEIGHT)
+    viewport = pygame.Rect(0, 0, int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale))
+    viewport.center = window.get_rect().center
+    window_view = window.subsurface(viewport)
+    screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+    window.fill(BLACK)
+
+def blit(source, dest, area=None):
+    # Drawing to the logical screen goes through here so it can be counted
+    PROFILER.count("blits")
+    return screen.blit(source, dest, area)
+
+def show_screen(rects):
+    # Push the logical screen to the window, rects being the regions drawn
+    if viewport is not None:
+        if rects:
+            pygame.transform.smoothscale(screen, viewport.size, window_view)
+            pygame.display.flip()
+    elif DIRTY_RENDERING:
+        if rects:
+            pygame.display.update(rects)
+    else:
+        pygame.display.flip()
+
+def cursor_visible():
+    return pygame.time.get_ticks() // CURSOR_BLINK_MS % 2 == 0
+
+def to_screen_pos(pos):
+    # Map a window position to the logical screen
+    if viewport is None:
+        return pos
+    return ((pos[0] - viewport.x) * SCREEN_WIDTH // viewport.width,
+            (pos[1] - viewport.y) * SCREEN_HEIGHT // viewport.height)
+
+def load_assets(names):
+    # Fill in the named background and font globals not loaded yet. A
+    # background still preloading is waited for
+    module = globals()
+    for name in names:
+        if module[name] is not None:
+            continue
+        if name in FONT_SIZES:
+            module[name] = load_font(FONT_SIZES[name])
+            continue
+        try:
+            module[name] = ASSETS.image(*BACKGROUNDS[name])
+        except (OSError, pygame.error) as e:
+            raise FileNotFoundError(f"Background image not found. Please ensure all image files are in the same directory as the script. Error: {e}")
+
+def load_font(size):
+    font = FONTS.get(size)
+    if font is None:
+        font = FONTS[size] = pygame.font.Font(FONT_PATH, size)
+    return font
+
+def render_text(font, text, color):
+    # Every label goes through the cache; only new strings get rasterized
+    misses = TEXT_CACHE.misses
+    surface = TEXT_CACHE.render(font, text, True, color)
+    if TEXT_CACHE.misses != misses:
+        PROFILER.count("text renders")
+        PROFILER.count("surfaces")
+    return surface
+
+# Player class, a rendering view over a sim.Fighter drawn with a skin's
+# animation frames. Fighters face each other, so facing is a rendering
+# concern only
+class Player(pygame.sprite.DirtySprite):
+    def __init__(self, fighter, color, skin=DEFAULT_SKIN):
         super().__init__()
-        self.image = pygame.Surface((PLAYER_WIDTH, PLAYER_HEIGHT))
-        self.image.fill(color)
-        self.rect = self.image.get_rect(topleft=(x, y))
-        self.speed = PLAYER_SPEED
-        self.health = 100
-        self.velocity_y = 0
-        self.jumping = False
-
-    def update(self, keys, up, down, left, right):
-        # Horizontal movement
-        if keys[left] and self.rect.left > 0:
-            self.rect.x -= self.speed
-        if keys[right] and self.rect.right < SCREEN_WIDTH:
-            self.rect.x += self.speed
-
-        # Jumping and gravity
-        if keys[up] and not self.jumping:
-            self.velocity_y = JUMP_SPEED
-            self.jumping = True
-
-        # Apply gravity
-        self.velocity_y += GRAVITY
-        self.rect.y += self.velocity_y
-
-        # Check floor collision
-        if self.rect.bottom > SCREEN_HEIGHT:
-            self.rect.bottom = SCREEN_HEIGHT
-            self.velocity_y = 0
-            self.jumping = False
-
-# Sword class
-class Sword(pygame.sprite.Sprite):
-    def __init__(self, player, color):
+        self.fighter = fighter
+        self.color = color
+        self.opponent = None  # The other Player, set once both exist
+        self.facing_left = False
+        self.set_skin(skin)
+        self.rect = self.image.get_rect(topleft=(fighter.x, fighter.y))
+
+    @property
+    def health(self):
+        return self.fighter.health
+
+    def set_skin(self, skin):
+        self.atlas = get_atlas(skin, self.color)
+        self.image = self.atlas.frame("idle", 0, self.facing_left)
+        self.dirty = 1
+
+    def update(self, alpha=1.0):
+        # Draw between the last two simulation ticks so motion stays smooth
+        # when the display rate and the tick rate differ
+        fighter = self.fighter
+        x = fighter.prev_x + (fighter.x - fighter.prev_x) * alpha
+        y = fighter.prev_y + (fighter.y - fighter.prev_y) * alpha
+        topleft = (round(x), round(y))
+        if topleft != self.rect.topleft:
+            self.rect.topleft = topleft
+            self.dirty = 1
+
+        if self.opponent is not None and self.opponent.fighter.x != fighter.x:
+            self.facing_left = self.opponent.fighter.x < fighter.x
+        if fighter.jumping:
+            animation = "jump"
+        elif fighter.x != fighter.prev_x:
+            animation = "walk"
+        else:
+            animation = "idle"
+        image = self.atlas.frame(animation, pygame.time.get_ticks() // ANIMATION_MS, self.facing_left)
+        if image is not self.image:
+            self.image = image
+            self.dirty = 1
+
+# Sword class, drawn wherever the simulation places the owner's sword and
+# swung through the skin's pre-rotated frames
+class Sword(pygame.sprite.DirtySprite):
+    def __init__(self, player):
         super().__init__()
-        self.image = pygame.Surface((SWORD_WIDTH, SWORD_HEIGHT))
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
         self.player = player
-        self.attacking = False
+        self.image = player.atlas.frame("swing", 0)
+        self.rect = self.image.get_rect(topleft=SWORD_IDLE_POS)
+        self.swing = None  # Fighter.swing of the swing being drawn
+        self.swing_start = 0
 
-    def update(self):
+    @property
+    def attacking(self):
+        return self.player.fighter.attacking
+
+    def update(self, alpha=1.0):
+        old_image, old_rect = self.image, self.rect.copy()
         if self.attacking:
-            self.rect.center = self.player.rect.center
+            fighter = self.player.fighter
+            now = pygame.time.get_ticks()
+            if fighter.swing != self.swing:
+                self.swing = fighter.swing
+                self.swing_start = now
+            atlas = self.player.atlas
+            index = min((now - self.swing_start) // SWING_MS, atlas.counts["swing"] - 1)
+            self.image = atlas.frame("swing", index, self.player.facing_left)
+            self.rect = self.image.get_rect(center=self.player.rect.center)
         else:
-            self.rect.topleft = (-100, -100)  # Move the sword off-screen when not attacking
+            self.rect.topleft = SWORD_IDLE_POS  # Move the sword off-screen when not attacking
+        if self.image is not old_image or self.rect != old_rect:
+            self.dirty = 1
+
+# Health bar with its value, redrawn only when the health changes
+class HealthBar(pygame.sprite.DirtySprite):
+    def __init__(self, player, color, x):
+        super().__init__()
+        self._layer = 1  # Above the fighters
+        self.image = pygame.Surface((250, 40), pygame.SRCALPHA)
+        self.rect = self.image.get_rect(topleft=(x, 30))
+        self.player = player
+        self.color = color
+        self.shown_health = None
+
+    def update(self, alpha=1.0):
+        health = self.player.health
+        if health == self.shown_health:
+            return
+        self.shown_health = health
+        self.image.fill((0, 0, 0, 0))
+        pygame.draw.rect(self.image, self.color, (0, 5, health * 2, 30))
+        health_text = render_text(FONT, f"{math.ceil(health)}", BLACK)
+        self.image.blit(health_text, (health, 0))
+        PROFILER.count("blits")
+        self.dirty = 1
 
 class Button:
-    def __init__(self, x, y, width, height, text, color, small_text=False):
+    def __init__(self, x, y, width, height, text, color, small_text=False, on_click=None):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.color = color
         self.is_hovered = False
         self.small_text = small_text
+        self.on_click = on_click
+        self.dirty = True  # Needs drawing on the next dirty-rect frame
 
     def draw(self, surface):
         color = (min(self.color[0] + 30, 255),
                 min(self.color[1] + 30, 255),
                 min(self.color[2] + 30, 255)) if self.is_hovered else self.color
         pygame.draw.rect(surface, color, self.rect)
+        self.draw_label(surface)
+
+    def draw_label(self, surface):
         # Use smaller font if small_text is True
         font = BUTTON_FONT if self.small_text else FONT
-        text_surface = font.render(self.text, True, BLACK)
+        text_surface = render_text(font, self.text, BLACK)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
+        PROFILER.count("blits")
+
+    # Called by the scene's WidgetIndex, which tracks the pointer
+    def set_hovered(self, hovered):
+        if hovered != self.is_hovered:
+            self.is_hovered = hovered
+            self.dirty = True
+
+    def click(self, event):
+        if self.on_click is not None:
+            self.on_click()
+
+# Button with a left or right pointing triangle, which the font has no glyph for
+class ArrowButton(Button):
+    def __init__(self, x, y, width, height, direction, color, on_click=None):
+        super().__init__(x, y, width, height, "", color, on_click=on_click)
+        self.direction = direction  # -1 for left, 1 for right
+
+    def draw_label(self, surface):
+        cx, cy = self.rect.center
+        tip = cx + 8 * self.direction
+        pygame.draw.polygon(surface, BLACK, [(tip, cy), (cx - 8 * self.direction, cy - 10), (cx - 8 * self.direction, cy + 10)])
+
+# A player's name box on the customize screen; typing goes to it while it has
+# focus
+class NameInput:
+    focusable = True
+
+    def __init__(self, scene, player_num, rect):
+        self.scene = scene
+        self.player_num = player_num
+        self.rect = rect
+
+    def set_hovered(self, hovered):
+        pass
+
+    def click(self, event):
+        self.scene.start_editing(self.player_num)
+
+    def key(self, event):
+        return self.scene.edit(event)
+
+    def blur(self):
+        self.scene.finish_editing()
+
+# One action's line in the controls panel; clicking it waits for a new binding
+class BindingRow:
+    def __init__(self, scene, player, action, rect):
+        self.scene = scene
+        self.player = player
+        self.action = action
+        self.rect = rect
+
+    def set_hovered(self, hovered):
+        pass
+
+    def click(self, event):
+        self.scene.start_rebind(self.player, self.action)
+
+# Scenes: one object per game state, picked by Game.state. A scene draws its
+# static layer (backgrounds, titles, panels) once, keeps it and puts it back
+# up on every full redraw; each frame it only handles events and draws the
+# widgets that changed. Mouse and focused key events go to the scene's
+# widgets first, through a grid index; handle() gets whatever they leave
+class Scene:
+    assets = []  # Background and font globals the scene draws with; buttons use FONT or BUTTON_FONT
+    idle = True  # Sleeps between inputs instead of running at FPS
+
+    def __init__(self, game):
+        self.game = game
+        self.buttons = []
+        self.widgets = WidgetIndex()
+        self.layer = None  # Copy of the static layer once drawn
+        self.layer_key = None  # What the layer was drawn for
+
+    def add_buttons(self, *buttons):
+        self.buttons.extend(buttons)
+        for button in buttons:
+            self.widgets.add(button)
+
+    def enter(self):
+        load_assets(self.assets)
+        # Hover state is only kept up to date while the scene is showing
+        self.widgets.reset(to_screen_pos(pygame.mouse.get_pos()))
+
+    def exit(self):
+        self.widgets.reset()
+
+    def handle(self, event):
+        pass
+
+    def update(self, elapsed):
+        pass
+
+    def draw(self):
+        if self.game.needs_redraw:
+            self.draw_static()
+        self.game.draw_buttons(*self.buttons)
+
+    def idle_timeout(self):
+        # Milliseconds until this screen next changes without any input
+        return IDLE_TIMEOUT_MS
+
+    def static_key(self):
+        # Whatever the static layer depends on; a change draws it again
+        return None
+
+    def draw_layer(self):
+        pass
+
+    def draw_static(self):
+        # The layer doubles as the background dirty widgets are erased with
+        key = self.static_key()
+        if self.layer is None or key != self.layer_key:
+            self.draw_layer()
+            self.layer = screen.copy()
+            self.layer_key = key
+            PROFILER.count("surfaces")
+        else:
+            blit(self.layer, (0, 0))
+        self.game.background = self.layer
+        self.game.dirty_rects.append(screen.get_rect())
 
-    def handle_event(self, event):
-        if event.type == pygame.MOUSEMOTION:
-            self.is_hovered = self.rect.collidepoint(event.pos)
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            if self.is_hovered:
-                return True
-        return False
+class MenuScene(Scene):
+    assets = ["MENU_BACKGROUND", "TITLE_FONT", "FONT", "BUTTON_FONT"]
 
-class Game:
-    def __init__(self):
-        self.state = "MENU"
-        # Store original screen dimensions
-        self.original_width = SCREEN_WIDTH
-        self.original_height = SCREEN_HEIGHT
-        self.is_fullscreen = FULLSCREEN
+    def __init__(self, game):
+        super().__init__(game)
+        self.start_button = Button(SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2, 200, 50, "Start Game", (100, 200, 100),
+                                   on_click=lambda: game.set_state("PREP"))
+        self.add_buttons(self.start_button, game.fullscreen_button)
+
+    def draw_layer(self):
+        # Draw menu background with overlay
+        blit(MENU_BACKGROUND, (0, 0))
 
-        # Add fullscreen button
-        self.fullscreen_button = Button(SCREEN_WIDTH - 220, 20, 200, 50, "Fullscreen", (100, 100, 200))
+        # Draw title
+        title_text = render_text(TITLE_FONT, "Pixel Gladiators", WHITE)
+        title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//3))
+        blit(title_text, title_rect)
 
-        # Main menu buttons
-        self.start_button = Button(SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2, 200, 50, "Start Game", (100, 200, 100))
-        # Game over button - added small_text=True
-        self.menu_button = Button(SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2 + 100, 200, 50, "Back to Lobby", (100, 200, 100), small_text=True)
-        # Prep screen buttons
-        self.play_button = Button(SCREEN_WIDTH - 220, SCREEN_HEIGHT - 80, 200, 50, "Play!", (100, 200, 100))
+class PrepScene(Scene):
+    assets = ["LOBBY_BACKGROUND", "MENU_OVERLAY", "SUBTITLE_FONT", "FONT", "BUTTON_FONT"]
+
+    # Controls panel layout. Increase menu width to accommodate longer text
+    PANEL_WIDTH = 300
+    PANEL_HEIGHT = 420
+    PANEL_POS = (SCREEN_WIDTH - PANEL_WIDTH - 20, (SCREEN_HEIGHT - PANEL_HEIGHT) // 2)
+    ROW_HEIGHT = 24
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.play_button = Button(SCREEN_WIDTH - 220, SCREEN_HEIGHT - 80, 200, 50, "Play!", (100, 200, 100),
+                                  on_click=lambda: game.set_state("CUSTOMIZE"))  # Changed from "PLAYING" to "CUSTOMIZE"
         # Move controls button to the left side within the overlay
-        self.controls_button = Button(50, 150, 200, 50, "Controls", (100, 100, 200))
+        self.controls_button = Button(50, 150, 200, 50, "Controls", (100, 100, 200), on_click=self.toggle_controls)
+        self.add_buttons(self.controls_button, game.fullscreen_button, self.play_button)
         self.show_controls = False
-        self.winner = None
+        self.rebinding = None  # (player, action) waiting for a key or controller input
+        self.panel = None  # Semi-transparent controls panel background
+        self.layers = {}  # static_key() -> static layer, kept unless mid-rebind
+
+        # One header and a row per action for each player, only clickable
+        # while the panel is open
+        x, y = self.PANEL_POS
+        top = y + 66
+        self.player_headers = []
+        self.binding_rows = []
+        for player in range(2):
+            self.player_headers.append((x + 20, top))
+            top += self.ROW_HEIGHT
+            for action, _ in ACTIONS:
+                rect = pygame.Rect(x + 10, top, self.PANEL_WIDTH - 20, self.ROW_HEIGHT)
+                self.binding_rows.append(BindingRow(self, player, action, rect))
+                top += self.ROW_HEIGHT
+            top += self.ROW_HEIGHT // 2
+
+    def toggle_controls(self):
+        self.show_controls = not self.show_controls
+        self.rebinding = None
+        for row in self.binding_rows:
+            if self.show_controls:
+                self.widgets.add(row)
+            else:
+                self.widgets.remove(row)
+        self.game.needs_redraw = True
+
+    def start_rebind(self, player, action):
+        self.rebinding = (player, action)
+        self.game.needs_redraw = True
+
+    def handle(self, event):
+        # Only reached by events no widget took: a click on empty space or
+        # Escape gives up on a rebind, any other key or controller input is
+        # the new binding
+        if self.rebinding is None:
+            return
+        game = self.game
+        if event.type == pygame.MOUSEBUTTONDOWN or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+            self.rebinding = None
+            game.needs_redraw = True
+            return
+        binding = game.controls.capture(event)
+        if binding is not None:
+            player, action = self.rebinding
+            game.controls.bind(player, action, binding)
+            game.save_controls()
+            self.rebinding = None
+            self.layers.clear()
+            game.needs_redraw = True
+
+    def static_key(self):
+        return (self.show_controls, self.game.controls.version, self.rebinding)
+
+    def draw_static(self):
+        # Opening and closing the panel swaps between kept layers
+        key = self.static_key()
+        self.layer = self.layers.get(key)
+        self.layer_key = key
+        super().draw_static()
+        if self.rebinding is None:
+            self.layers[key] = self.layer
+
+    def draw_layer(self):
+        # Draw lobby background
+        blit(LOBBY_BACKGROUND, (0, 0))
+        blit(MENU_OVERLAY, (0, 0))
 
-        # Add customization screen buttons
-        self.start_fight_button = Button(SCREEN_WIDTH - 220, SCREEN_HEIGHT - 80, 200, 50, "Start Fight!", (100, 200, 100))
-        self.player1_name_button = Button(100, 200, 200, 50, DEFAULT_PLAYER1_NAME, (200, 100, 100))
-        self.player2_name_button = Button(SCREEN_WIDTH - 300, 200, 200, 50, DEFAULT_PLAYER2_NAME, (100, 100, 200))
+        # Draw title in the menu overlay
+        title_text = render_text(SUBTITLE_FONT, "Pixel Gladiators", WHITE)
+        # Position the title at 1/4 of screen width (center of left half) and near the top
+        title_rect = title_text.get_rect(center=(SCREEN_WIDTH//3.5, 80))
+        blit(title_text, title_rect)
 
-        # Player names
-        self.player1_name = DEFAULT_PLAYER1_NAME
-        self.player2_name = DEFAULT_PLAYER2_NAME
+        if self.show_controls:
+            self.draw_controls()
+
+    def draw_controls(self):
+        menu_x, menu_y = self.PANEL_POS
+        menu_width, menu_height = self.PANEL_WIDTH, self.PANEL_HEIGHT
+
+        # Draw semi-transparent menu background
+        if self.panel is None:
+            self.panel = pygame.Surface((menu_width, menu_height))
+            self.panel.fill((50, 50, 50))
+            self.panel.set_alpha(200)
+            PROFILER.count("surfaces")
+        blit(self.panel, (menu_x, menu_y))
+
+        # Draw menu border
+        pygame.draw.rect(screen, WHITE, (menu_x, menu_y, menu_width, menu_height), 2)
+
+        # Draw "Controls" header
+        controls_text = render_text(FONT, "Controls", WHITE)
+        controls_rect = controls_text.get_rect(center=(menu_x + menu_width // 2.5, menu_y + 30))
+        blit(controls_text, controls_rect)
+
+        # Draw player headers in a different style
+        for player, pos in enumerate(self.player_headers):
+            blit(render_text(FONT, f"Player {player + 1}", (200, 200, 100)), pos)
+
+        # Draw each action with what it is bound to, or a prompt while rebinding
+        controls = self.game.controls
+        for row in self.binding_rows:
+            action_text = render_text(BUTTON_FONT, row.action.capitalize(), WHITE)
+            blit(action_text, (row.rect.x + 20, row.rect.y))
+            if self.rebinding == (row.player, row.action):
+                binding_text = render_text(BUTTON_FONT, "Press a key", (200, 200, 100))
+            else:
+                binding_text = render_text(BUTTON_FONT, controls.label(row.player, row.action), WHITE)
+            blit(binding_text, (menu_x + menu_width - 160, row.rect.y))
+
+        hint_text = render_text(BUTTON_FONT, "Click to rebind", (150, 150, 150))
+        hint_rect = hint_text.get_rect(center=(menu_x + menu_width // 2, menu_y + menu_height - 20))
+        blit(hint_text, hint_rect)
+
+class CustomizeScene(Scene):
+    assets = ["LOBBY_BACKGROUND", "CUSTOMIZE_FONT", "SUBTITLE_FONT", "FONT", "BUTTON_FONT"]
+
+    # Name input boxes, by player number
+    NAME_INPUT_RECTS = {
+        1: pygame.Rect(100, 260, 200, 40),
+        2: pygame.Rect(SCREEN_WIDTH - 300, 260, 200, 40),
+    }
+    # Skin picker: a preview box with the skin's name and arrows beside it
+    SKIN_PREVIEW_RECTS = {
+        1: pygame.Rect(100, 392, 104, 104),
+        2: pygame.Rect(SCREEN_WIDTH - 300, 392, 104, 104),
+    }
+    SKIN_NAME_RECTS = {
+        1: pygame.Rect(206, 452, 96, 34),
+        2: pygame.Rect(SCREEN_WIDTH - 194, 452, 96, 34),
+    }
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.start_fight_button = Button(SCREEN_WIDTH - 220, SCREEN_HEIGHT - 80, 200, 50, "Start Fight!", (100, 200, 100),
+                                         on_click=game.start_match)
+        # Player 2 can be left to the CPU at any difficulty
+        self.opponent_button = Button(SCREEN_WIDTH - 300, 205, 200, 40, self.opponent_label(), (100, 100, 200),
+                                      small_text=True, on_click=self.change_opponent)
+        self.add_buttons(self.start_fight_button, game.fullscreen_button, self.opponent_button)
+        for player_num, rect in self.NAME_INPUT_RECTS.items():
+            self.widgets.add(NameInput(self, player_num, rect))
+        for player_num, rect in self.SKIN_PREVIEW_RECTS.items():
+            self.add_buttons(
+                ArrowButton(rect.right + 8, 400, 40, 40, -1, (100, 100, 200),
+                            on_click=lambda player_num=player_num: self.change_skin(player_num, -1)),
+                ArrowButton(rect.right + 54, 400, 40, 40, 1, (100, 100, 200),
+                            on_click=lambda player_num=player_num: self.change_skin(player_num, 1)))
 
         # Text input state
         self.active_input = None
         self.input_text = ""
+        self.drawn_inputs = None  # Name input contents last drawn
+        self.drawn_skins = None  # Skins last drawn in the pickers
 
-        self.setup_game_objects()
+    def exit(self):
+        # Leaving the screen cancels an unfinished edit
+        self.stop_editing()
+        super().exit()
 
-    def setup_game_objects(self):
-        # Initialize players
-        self.player1 = Player(100, SCREEN_HEIGHT // 2, RED)
-        self.player2 = Player(SCREEN_WIDTH - 150, SCREEN_HEIGHT // 2, BLUE)
+    def idle_timeout(self):
+        if self.active_input:
+            return CURSOR_BLINK_MS - pygame.time.get_ticks() % CURSOR_BLINK_MS + 1
+        return IDLE_TIMEOUT_MS
 
-        # Initialize swords
-        self.sword1 = Sword(self.player1, RED)
-        self.sword2 = Sword(self.player2, BLUE)
+    def start_editing(self, player_num):
+        self.active_input = player_num
+        self.input_text = self.game.player1_name if player_num == 1 else self.game.player2_name
 
-        # Groups
-        self.all_sprites = pygame.sprite.Group(self.player1, self.player2, self.sword1, self.sword2)
-
-    def toggle_fullscreen(self):
-        global screen, SCREEN_WIDTH, SCREEN_HEIGHT
-        self.is_fullscreen = not self.is_fullscreen
-
-        if self.is_fullscreen:
-            # Get the current display info
-            display_info = pygame.display.Info()
-            SCREEN_WIDTH = display_info.current_w
-            SCREEN_HEIGHT = display_info.current_h
-            screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
-            self.fullscreen_button.text = "Unfullscreen"  # Change button text
-        else:
-            SCREEN_WIDTH = self.original_width
-            SCREEN_HEIGHT = self.original_height
-            screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-            self.fullscreen_button.text = "Fullscreen"  # Change button text back
-
-        # Update button positions for new screen size
-        self.update_button_positions()
-
-        # Rescale background images
-        self.scale_backgrounds()
-
-    def scale_backgrounds(self):
-        global GAME_BACKGROUND, LOBBY_BACKGROUND, MENU_BACKGROUND, MENU_OVERLAY
-
-        GAME_BACKGROUND = pygame.transform.scale(GAME_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        LOBBY_BACKGROUND = pygame.transform.scale(LOBBY_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        MENU_BACKGROUND = pygame.transform.scale(MENU_BACKGROUND, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        MENU_OVERLAY = pygame.transform.scale(MENU_OVERLAY, (SCREEN_WIDTH/1.5, SCREEN_HEIGHT))
-
-    def update_button_positions(self):
-        # Update button positions based on new screen size
-        self.fullscreen_button.rect.topleft = (SCREEN_WIDTH - 220, 20)
-        self.start_button.rect.center = (SCREEN_WIDTH//2, SCREEN_HEIGHT//2)
-        self.menu_button.rect.center = (SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 100)
-        self.play_button.rect.bottomright = (SCREEN_WIDTH - 20, SCREEN_HEIGHT - 20)
-        self.controls_button.rect.topleft = (50, 150)
-        self.start_fight_button.rect.bottomright = (SCREEN_WIDTH - 20, SCREEN_HEIGHT - 20)
-        self.player1_name_button.rect.topleft = (100, 200)
-        self.player2_name_button.rect.topleft = (SCREEN_WIDTH - 300, 200)
-
-    def run_menu(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
-            if self.start_button.handle_event(event):
-                self.state = "PREP"
-            if self.fullscreen_button.handle_event(event):
-                self.toggle_fullscreen()
-
-        # Draw menu background with overlay
-        screen.blit(MENU_BACKGROUND, (0, 0))
-
-        # Draw title
-        title_text = TITLE_FONT.render("Pixel Gladiators", True, WHITE)
-        title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//3))
-        screen.blit(title_text, title_rect)
+    def stop_editing(self):
+        self.active_input = None
+        self.input_text = ""
 
-        self.start_button.draw(screen)
-        self.fullscreen_button.draw(screen)
+    def finish_editing(self):
+        # A click outside the box keeps what was typed, if anything
+        game = self.game
+        if self.active_input == 1:
+            game.player1_name = self.input_text if self.input_text else game.player1_name
+        elif self.active_input == 2:
+            game.player2_name = self.input_text if self.input_text else game.player2_name
+        self.stop_editing()
+
+    def edit(self, event):
+        # A key pressed while a name box has focus; False once editing is over
+        game = self.game
+        if event.key == pygame.K_RETURN:
+            # Save the name and exit input mode
+            if self.active_input == 1:
+                game.player1_name = self.input_text if self.input_text else DEFAULT_PLAYER1_NAME
+            else:
+                game.player2_name = self.input_text if self.input_text else DEFAULT_PLAYER2_NAME
+            self.stop_editing()
+            return False
+        if event.key == pygame.K_ESCAPE:  # Add escape to cancel editing
+            self.stop_editing()
+            return False
+        if event.key == pygame.K_BACKSPACE:
+            self.input_text = self.input_text[:-1]
+        # Limit name length to 12 characters
+        elif len(self.input_text) < 12:
+            self.input_text += event.unicode
         return True
 
-    def run_prep_screen(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
-            if self.play_button.handle_event(event):
-                self.state = "CUSTOMIZE"  # Changed from "PLAYING" to "CUSTOMIZE"
-            if self.controls_button.handle_event(event):
-                self.show_controls = not self.show_controls
-            if self.fullscreen_button.handle_event(event):
-                self.toggle_fullscreen()
-
-        # Draw lobby background
-        screen.blit(LOBBY_BACKGROUND, (0, 0))
-        screen.blit(MENU_OVERLAY, (0, 0))
-
-        # Draw title in the menu overlay
-        title_text = SUBTITLE_FONT.render("Pixel Gladiators", True, WHITE)
-        # Position the title at 1/4 of screen width (center of left half) and near the top
-        title_rect = title_text.get_rect(center=(SCREEN_WIDTH//3.5, 80))
-        screen.blit(title_text, title_rect)
-
-        if self.show_controls:
-            # Increase menu width to accommodate longer text
-            menu_width = 300  # Increased from 300
-            menu_height = 400
-            menu_x = SCREEN_WIDTH - menu_width - 20
-            menu_y = (SCREEN_HEIGHT - menu_height) // 2
-
-            # Draw semi-transparent menu background
-            menu_surface = pygame.Surface((menu_width, menu_height))
-            menu_surface.fill((50, 50, 50))
-            menu_surface.set_alpha(200)
-            screen.blit(menu_surface, (menu_x, menu_y))
-
-            # Draw menu border
-            pygame.draw.rect(screen, WHITE, (menu_x, menu_y, menu_width, menu_height), 2)
-
-            # Draw "Controls" header
-            controls_text = FONT.render("Controls", True, WHITE)
-            controls_rect = controls_text.get_rect(center=(menu_x + menu_width // 2.5, menu_y + 30))
-            screen.blit(controls_text, controls_rect)
-
-            # Draw instructions in the menu with better spacing
-            instructions = [
-                ("Player 1", ""),
-                ("WASD", "Movement"),
-                ("SPACE", "Attack"),
-                ("", ""),
-                ("Player 2", ""),
-                ("Arrow Keys", "Movement"),
-                ("ENTER", "Attack")
-            ]
-
-            y_offset = menu_y + 80
-            for control, action in instructions:
-                if control:  # If it's not just a spacer
-                    if control in ["Player 1:", "Player 2:"]:
-                        # Draw player headers in a different style
-                        text = FONT.render(control, True, (200, 200, 100))
-                        screen.blit(text, (menu_x + 20, y_offset))
-                    else:
-                        # Draw control key with adjusted spacing
-                        control_text = FONT.render(control, True, WHITE)
-                        screen.blit(control_text, (menu_x + 30, y_offset))
-
-                        # Draw action description with more space
-                        action_text = FONT.render(action, True, WHITE)
-                        # Adjust position to prevent overlap
-                        action_x = menu_x + menu_width - 160  # Moved further left and adjusted for wider menu
-                        screen.blit(action_text, (action_x, y_offset))
-
-                y_offset += 50  # Increased vertical spacing further
-
-        self.controls_button.draw(screen)
-        self.fullscreen_button.draw(screen)
-        self.play_button.draw(screen)
-        return True
+    def change_skin(self, player_num, step):
+        game = self.game
+        if player_num == 1:
+            game.player1_skin = next_skin(game.player1_skin, step)
+            game.player1.set_skin(game.player1_skin)
+        else:
+            game.player2_skin = next_skin(game.player2_skin, step)
+            game.player2.set_skin(game.player2_skin)
+
+    def opponent_label(self):
+        level = self.game.cpu_level
+        return "Human" if level is None else f"CPU {level.capitalize()}"
+
+    def change_opponent(self):
+        levels = [None, *DIFFICULTIES]
+        game = self.game
+        game.cpu_level = levels[(levels.index(game.cpu_level) + 1) % len(levels)]
+        self.opponent_button.text = self.opponent_label()
+        self.opponent_button.dirty = True
+
+    def draw(self):
+        game = self.game
+        if game.needs_redraw:
+            self.draw_static()
+
+        # Draw name input boxes with text input styling, only when their
+        # contents or the active box changed
+        inputs = (self.active_input, self.input_text, game.player1_name, game.player2_name, cursor_visible())
+        if game.needs_redraw or inputs != self.drawn_inputs:
+            self.drawn_inputs = inputs
+            self.draw_name_input(1)
+            self.draw_name_input(2)
+
+        skins = (game.player1_skin, game.player2_skin)
+        if game.needs_redraw or skins != self.drawn_skins:
+            self.drawn_skins = skins
+            self.draw_skin_picker(1)
+            self.draw_skin_picker(2)
 
-    def run_customize_screen(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
-            if event.type == pygame.KEYDOWN and self.active_input:
-                if event.key == pygame.K_RETURN:
-                    # Save the name and exit input mode
-                    if self.active_input == 1:
-                        self.player1_name = self.input_text if self.input_text else DEFAULT_PLAYER1_NAME
-                    else:
-                        self.player2_name = self.input_text if self.input_text else DEFAULT_PLAYER2_NAME
-                    self.active_input = None
-                    self.input_text = ""
-                elif event.key == pygame.K_BACKSPACE:
-                    self.input_text = self.input_text[:-1]
-                elif event.key == pygame.K_ESCAPE:  # Add escape to cancel editing
-                    self.active_input = None
-                    self.input_text = ""
-                else:
-                    # Limit name length to 12 characters
-                    if len(self.input_text) < 12:
-                        self.input_text += event.unicode
-            # Handle mouse clicks outside input boxes to deselect
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = event.pos
-                input1_rect = pygame.Rect(100, 260, 200, 40)
-                input2_rect = pygame.Rect(SCREEN_WIDTH - 300, 260, 200, 40)
-                if not input1_rect.collidepoint(mouse_pos) and not input2_rect.collidepoint(mouse_pos):
-                    if self.active_input == 1:
-                        self.player1_name = self.input_text if self.input_text else self.player1_name
-                    elif self.active_input == 2:
-                        self.player2_name = self.input_text if self.input_text else self.player2_name
-                    self.active_input = None
-                    self.input_text = ""
-
-            if self.start_fight_button.handle_event(event):
-                self.state = "PLAYING"
-            elif self.fullscreen_button.handle_event(event):
-                self.toggle_fullscreen()
+        # Draw buttons
+        game.draw_buttons(*self.buttons)
 
+    def draw_layer(self):
         # Draw background
-        screen.blit(LOBBY_BACKGROUND, (0, 0))
+        blit(LOBBY_BACKGROUND, (0, 0))
 
         # Draw title with smaller font
-        title_text = CUSTOMIZE_FONT.render("Customize Characters", True, WHITE)
+        title_text = render_text(CUSTOMIZE_FONT, "Customize Characters", WHITE)
         title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, 80))
-        screen.blit(title_text, title_rect)
+        blit(title_text, title_rect)
 
         # Draw player sections
         self.draw_player_section(1)
         self.draw_player_section(2)
 
-        # Draw name input boxes with text input styling
-        self.draw_name_input(1)
-        self.draw_name_input(2)
-
-        # Draw buttons
-        self.start_fight_button.draw(screen)
-        self.fullscreen_button.draw(screen)
-
-        return True
-
     def draw_name_input(self, player_num):
-        x = 100 if player_num == 1 else SCREEN_WIDTH - 300
-        y = 260
-        width = 200
-        height = 40
-
-        # Create input box rect
-        input_rect = pygame.Rect(x, y, width, height)
+        input_rect = self.NAME_INPUT_RECTS[player_num]
+        x, y, width, height = input_rect
 
-        # Handle mouse clicks on the input box
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_clicked = pygame.mouse.get_pressed()[0]  # Left mouse button
-        if mouse_clicked and input_rect.collidepoint(mouse_pos):
-            self.active_input = player_num
-            self.input_text = self.player1_name if player_num == 1 else self.player2_name
+        # Erase the box and the hint below it
+        self.game.restore_background((x, y, width, height + 40))
 
         # Draw input box background
         box_color = (100, 100, 100) if self.active_input == player_num else (70, 70, 70)
@@ -418,137 +748,488 @@ class Game:
 
         # Draw current name or active input text
         if self.active_input == player_num:
-            text = self.input_text + "_"  # Add cursor
+            text = self.input_text + ("_" if cursor_visible() else "")  # Blinking cursor
         else:
-            text = self.player1_name if player_num == 1 else self.player2_name
+            text = self.game.player1_name if player_num == 1 else self.game.player2_name
 
-        text_surface = FONT.render(text, True, WHITE)
+        text_surface = render_text(FONT, text, WHITE)
         text_rect = text_surface.get_rect(center=input_rect.center)
-        screen.blit(text_surface, text_rect)
+        blit(text_surface, text_rect)
 
         # Draw "Click to edit" hint if not active
         if not self.active_input:
-            hint_text = BUTTON_FONT.render("Click to edit", True, (150, 150, 150))
+            hint_text = render_text(BUTTON_FONT, "Click to edit", (150, 150, 150))
             hint_rect = hint_text.get_rect(center=(x + width//2, y + height + 20))
-            screen.blit(hint_text, hint_rect)
+            blit(hint_text, hint_rect)
 
     def draw_player_section(self, player_num):
         x = 100 if player_num == 1 else SCREEN_WIDTH - 300
         y = 150
 
         # Draw section title
-        section_text = SUBTITLE_FONT.render(f"Player {player_num}", True, WHITE)
+        section_text = render_text(SUBTITLE_FONT, f"Player {player_num}", WHITE)
         section_rect = section_text.get_rect(topleft=(x, y))
-        screen.blit(section_text, section_rect)
+        blit(section_text, section_rect)
+
+        # Draw skin selection label and preview box
+        skin_text = render_text(FONT, "Skin Selection", WHITE)
+        blit(skin_text, (x, y + 200))  # Moved down to accommodate name input
+        pygame.draw.rect(screen, WHITE, self.SKIN_PREVIEW_RECTS[player_num], 2)
+
+    def draw_skin_picker(self, player_num):
+        game = self.game
+        player = game.player1 if player_num == 1 else game.player2
+        skin = game.player1_skin if player_num == 1 else game.player2_skin
+
+        # Erase the preview inside the box border and the skin name
+        preview_rect = self.SKIN_PREVIEW_RECTS[player_num].inflate(-4, -4)
+        name_rect = self.SKIN_NAME_RECTS[player_num]
+        game.restore_background(preview_rect)
+        game.restore_background(name_rect)
+
+        blit(player.atlas.preview(preview_rect.size), preview_rect)
+        name_text = render_text(BUTTON_FONT, skin, WHITE)
+        blit(name_text, name_text.get_rect(center=name_rect.center))
+
+class PlayingScene(Scene):
+    assets = ["GAME_BACKGROUND", "FONT", "BUTTON_FONT"]
+    idle = False
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.particles = ParticlePool()
+        self.particle_rect = None  # Area the particles covered last frame
+        self.seen = None  # Each fighter's (health, jumping) last frame
+        self.ko_time = None  # Seconds since the knockout, while its burst plays
+
+    def enter(self):
+        super().enter()
+        self.particles.clear()
+        self.particle_rect = None
+        self.seen = None
+        self.ko_time = None
+
+    def emit_effects(self, state):
+        # The simulation has no event stream; hits and landings show up as
+        # changes in the fighters from one frame to the next
+        fighters = state.fighters
+        seen = [(fighter.health, fighter.jumping) for fighter in fighters]
+        if self.seen is not None and self.seen != seen:
+            for i, fighter in enumerate(fighters):
+                health, jumping = self.seen[i]
+                if fighter.health < health:
+                    # Sparks where the sword meets the body
+                    body = pygame.Rect(fighter.rect())
+                    contact = body.clip(fighters[1 - i].sword_rect())
+                    x, y = (contact or body).center
+                    self.particles.emit(x, y, **HIT_SPARKS)
+                if jumping and not fighter.jumping:
+                    self.particles.emit(fighter.x + PLAYER_WIDTH / 2, fighter.y + PLAYER_HEIGHT, **LANDING_DUST)
+        self.seen = seen
+
+    def update(self, elapsed):
+        game = self.game
+
+        # Run as many fixed ticks as the elapsed time covers, all with this
+        # frame's keyboard and controller snapshot
+        inputs = game.controls.read(pygame.key.get_pressed())
+        state = game.sim.state
+        with PROFILER.stage("simulate"):
+            for _ in range(game.timestep.advance(elapsed)):
+                # No point planning once someone has won; the ticks left only
+                # play out the knockout
+                if game.cpu is not None and state.winner is None:
+                    with PROFILER.stage("cpu"):
+                        inputs = (inputs[0], game.cpu.act(state, 1))
+                try:
+                    state = game.driver.step(inputs)
+                except ConnectionError:
+                    # Only a broadcast's server can go away mid-match
+                    game.leave_broadcast()
+                    return
+                if game.telemetry is not None:
+                    game.log_tick(state)
+                PROFILER.count("ticks")
+        with PROFILER.stage("sprites"):
+            game.all_sprites.update(game.timestep.alpha)
+        with PROFILER.stage("particles"):
+            self.emit_effects(state)
+            self.particles.update(elapsed)
+
+        # Check for game over. Online, a knockout only counts once it no
+        # longer depends on predicted inputs. The burst plays out first
+        if self.ko_time is not None:
+            self.ko_time += elapsed
+            if self.ko_time >= KO_SECONDS:
+                game.state = "GAME_OVER"
+                game.finish_match()
+        elif state.winner is not None and getattr(game.driver, "confirmed", True):
+            game.winner = state.winner
+            loser = game.player2 if state.winner == 1 else game.player1
+            self.particles.emit(*loser.rect.center, tint=loser.color, **KO_BURST)
+            self.ko_time = 0.0
+        elif game.replay is not None and game.driver.finished:
+            # The recording stopped before anyone won
+            game.finish_match()
+            game.state = "PREP"
+            game.setup_game_objects()
+
+    def draw(self):
+        # Sprites and health bars erase themselves from the background and
+        # only the areas they touched are pushed
+        game = self.game
+        with PROFILER.stage("draw"):
+            if game.needs_redraw:
+                game.all_sprites.clear(screen, GAME_BACKGROUND)
+                game.all_sprites.repaint_rect(screen.get_rect())
+            elif self.particle_rect is not None:
+                # Last frame's particles come off with the sprites' own erasing
+                game.all_sprites.repaint_rect(self.particle_rect)
+            rects = game.all_sprites.draw(screen)
+        PROFILER.count("blits", len(rects))
+        game.dirty_rects.extend(rects)
+
+        # Particles go over everything, in one pass
+        with PROFILER.stage("particles"):
+            self.particle_rect = self.particles.draw(screen)
+        if self.particle_rect is not None:
+            game.dirty_rects.append(self.particle_rect)
+
+class GameOverScene(Scene):
+    assets = ["LOBBY_BACKGROUND", "TITLE_FONT", "FONT", "BUTTON_FONT"]
+
+    def __init__(self, game):
+        super().__init__(game)
+        # Game over button - added small_text=True
+        self.menu_button = Button(SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2 + 100, 200, 50, "Back to Lobby", (100, 200, 100), small_text=True,
+                                  on_click=self.back_to_lobby)
+        self.add_buttons(self.menu_button)
 
-        # Draw placeholder for future skin selection
-        skin_text = FONT.render("Skin Selection", True, WHITE)
-        screen.blit(skin_text, (x, y + 200))  # Moved down to accommodate name input
+    def back_to_lobby(self):
+        self.game.state = "PREP"
+        self.game.setup_game_objects()  # Reset game for next round
 
-        # Draw skin preview box
-        preview_rect = pygame.Rect(x, y + 250, 150, 150)  # Moved down to accommodate name input
-        pygame.draw.rect(screen, WHITE, preview_rect, 2)
-        coming_soon = FONT.render("Coming Soon!", True, WHITE)
-        coming_soon_rect = coming_soon.get_rect(center=preview_rect.center)
-        screen.blit(coming_soon, coming_soon_rect)
+    def static_key(self):
+        return self.winner_name()
 
-    def run_game_over(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
-            if self.menu_button.handle_event(event):
-                self.state = "PREP"
-                self.setup_game_objects()  # Reset game for next round
+    def winner_name(self):
+        game = self.game
+        return game.player1_name if game.winner == 1 else game.player2_name
 
-        screen.blit(LOBBY_BACKGROUND, (0, 0))
+    def draw_layer(self):
+        blit(LOBBY_BACKGROUND, (0, 0))
 
         # Draw winner text using custom name
-        winner_name = self.player1_name if self.winner == 1 else self.player2_name
-        winner_text = TITLE_FONT.render(f"{winner_name} Wins!", True, WHITE)
+        winner_text = render_text(TITLE_FONT, f"{self.winner_name()} Wins!", WHITE)
         winner_rect = winner_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//3))
-        screen.blit(winner_text, winner_rect)
+        blit(winner_text, winner_rect)
 
-        self.menu_button.draw(screen)
-        return True
+class Game:
+    def __init__(self, record_dir=None, replay=None, net=None, feed=None, controls_file=None, telemetry=None,
+                 cpu=None):
+        self.state = "MENU"
+        self.is_fullscreen = FULLSCREEN
+        self.record_dir = record_dir  # Save a replay of every match here
+        self.replay = replay  # Replay to watch instead of playing
+        self.net = net  # (socket, local player index, peer address) for online play
+        self.feed = feed  # Broadcast to watch, kept across matches
+        self.telemetry = telemetry  # Match event log, if kept
+        self.cpu_level = cpu  # Difficulty of the CPU playing player 2, None for a human
+        self.cpu = None  # Its policy during a local match
+        self.hud = None  # Profiler HUD while shown
+        self.matches_started = 0
+        self.winner = None
 
-    def run_game(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
+        # Key and controller bindings, saved back to controls_file on a rebind
+        self.controls_file = controls_file
+        if controls_file and os.path.exists(controls_file):
+            self.controls = Controls.load(controls_file)
+        else:
+            self.controls = Controls()
 
-        keys = pygame.key.get_pressed()
-        self.player1.update(keys, *player1_keys)
-        self.player2.update(keys, *player2_keys)
+        # Add fullscreen button, shared by the screens that show it
+        self.fullscreen_button = Button(SCREEN_WIDTH - 220, 20, 200, 50, "Fullscreen", (100, 100, 200),
+                                        on_click=self.toggle_fullscreen)
 
-        # Sword attacks
-        if keys[pygame.K_SPACE]:
-            self.sword1.attacking = True
-        else:
-            self.sword1.attacking = False
+        # Player names and skins
+        self.player1_name = DEFAULT_PLAYER1_NAME
+        self.player2_name = DEFAULT_PLAYER2_NAME
+        self.player1_skin = DEFAULT_SKIN
+        self.player2_skin = DEFAULT_SKIN
+
+        # Dirty-rect rendering state
+        self.needs_redraw = True  # Redraw the whole screen on the next frame
+        self.dirty_rects = []
+        self.background = None  # Static part of the current screen
+
+        self.scenes = {
+            "MENU": MenuScene(self),
+            "PREP": PrepScene(self),
+            "CUSTOMIZE": CustomizeScene(self),
+            "PLAYING": PlayingScene(self),
+            "GAME_OVER": GameOverScene(self),
+        }
+        self.scene = None  # Scene that ran the last frame
 
-        if keys[pygame.K_RETURN]:
-            self.sword2.attacking = True
+        self.setup_game_objects()
+        # A replay or a broadcast starts playing straight away
+        if replay is not None:
+            self.player1_name, self.player2_name = replay.names
+        elif feed is not None:
+            self.player1_name, self.player2_name = feed.names
+        if replay is not None or feed is not None:
+            self.start_match()
+
+    def setup_game_objects(self):
+        # The simulation owns the match state; the sprites below only draw it.
+        # Each tick goes through self.driver, which is the simulation itself,
+        # a recorder wrapping it, a replay feeding it recorded inputs, a
+        # rollback session playing against a remote peer or a broadcast
+        # copying the server's state into it
+        if self.feed is not None:
+            self.sim = self.feed.sim = Simulation(tick_rate=self.feed.tick_rate)
+            self.driver = self.feed
+        elif self.replay is not None:
+            self.driver = ReplayPlayer(self.replay)
+            self.sim = self.driver.sim
         else:
-            self.sword2.attacking = False
-
-        # Update swords
-        self.sword1.update()
-        self.sword2.update()
-
-        # Check for collisions and apply damage
-        if self.sword1.attacking and pygame.sprite.collide_rect(self.sword1, self.player2):
-            self.player2.health = max(self.player2.health - SWORD_DAMAGE, 0)
-        if self.sword2.attacking and pygame.sprite.collide_rect(self.sword2, self.player1):
-            self.player1.health = max(self.player1.health - SWORD_DAMAGE, 0)
-
-        # Check for game over
-        if self.player1.health <= 0:
-            self.winner = 2
-            self.state = "GAME_OVER"
-        elif self.player2.health <= 0:
-            self.winner = 1
-            self.state = "GAME_OVER"
-
-        # Drawing
-        screen.blit(GAME_BACKGROUND, (0, 0))
-        self.all_sprites.draw(screen)
-
-        # Display health bars
-        pygame.draw.rect(screen, RED, (50, 35, self.player1.health * 2, 30))
-        pygame.draw.rect(screen, BLUE, (SCREEN_WIDTH - 250, 35, self.player2.health * 2, 30))
-
-        # Display health values
-        player1_health_text = FONT.render(f"{self.player1.health}", True, BLACK)
-        player2_health_text = FONT.render(f"{self.player2.health}", True, BLACK)
-        screen.blit(player1_health_text, (50 + self.player1.health, 30))
-        screen.blit(player2_health_text, (SCREEN_WIDTH - 250 + self.player2.health, 30))
+            self.sim = Simulation(tick_rate=TICK_RATE)
+            self.driver = self.sim
+        self.timestep = FixedTimestep(self.sim.tick_rate)
+        fighter1, fighter2 = self.sim.state.fighters
+
+        # Initialize players
+        self.player1 = Player(fighter1, RED, self.player1_skin)
+        self.player2 = Player(fighter2, BLUE, self.player2_skin)
+        self.player1.opponent = self.player2
+        self.player2.opponent = self.player1
+
+        # Initialize swords
+        self.sword1 = Sword(self.player1)
+        self.sword2 = Sword(self.player2)
+
+        # Health bars
+        self.health_bar1 = HealthBar(self.player1, RED, 50)
+        self.health_bar2 = HealthBar(self.player2, BLUE, SCREEN_WIDTH - 250)
+
+        # Groups
+        self.all_sprites = pygame.sprite.LayeredDirty(self.player1, self.player2, self.sword1, self.sword2,
+                                                      self.health_bar1, self.health_bar2)
 
+    def set_state(self, state):
+        self.state = state
+
+    def save_controls(self):
+        if self.controls_file:
+            self.controls.save(self.controls_file)
+
+    def toggle_fullscreen(self):
+        # Only the window changes; the logical screen, layout and assets stay
+        self.is_fullscreen = not self.is_fullscreen
+        set_display_mode(self.is_fullscreen)
+        self.fullscreen_button.text = "Unfullscreen" if self.is_fullscreen else "Fullscreen"
+        self.needs_redraw = True
+
+    def toggle_hud(self):
+        if self.hud is None:
+            self.hud = ProfilerHud(PROFILER, pygame.font.Font(None, 16))
+            PROFILER.enable()
+        else:
+            self.hud = None
+            PROFILER.enable(PROFILER.trace is not None)
+            self.needs_redraw = True
+
+    def get_events(self):
+        if self.scene.idle and not self.needs_redraw:
+            # Block until there is something to react to
+            with PROFILER.stage("idle"):
+                event = pygame.event.wait(self.scene.idle_timeout())
+            events = [] if event.type == pygame.NOEVENT else [event]
+        else:
+            events = []
+        with PROFILER.stage("events"):
+            events += pygame.event.get()
+        for i, event in enumerate(events):
+            # The window contents may have been lost, repaint all of it
+            if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                self.needs_redraw = True
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.toggle_hud()
+            elif event.type in (pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED):
+                self.controls.handle(event)
+            elif viewport is not None and hasattr(event, "pos"):
+                events[i] = pygame.event.Event(event.type, dict(event.dict, pos=to_screen_pos(event.pos)))
+        return events
+
+    def restore_background(self, rect):
+        if not self.needs_redraw:
+            blit(self.background, rect, rect)
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    def draw_buttons(self, *buttons):
+        for button in buttons:
+            if self.needs_redraw or button.dirty:
+                self.restore_background(button.rect)
+                button.draw(screen)
+                button.dirty = False
+
+    def present(self, drawn_state):
+        # The HUD goes on top of the finished frame and comes off again once
+        # it is shown, leaving the screen as the scene drew it
+        if self.hud is not None:
+            with PROFILER.stage("hud"):
+                self.dirty_rects.append(self.hud.draw(screen))
+        with PROFILER.stage("present"):
+            show_screen(self.dirty_rects)
+        if self.hud is not None:
+            self.hud.erase(screen)
+        self.dirty_rects = []
+        # A scene that switched state this frame drew the old screen, so the
+        # new one starts with a full redraw
+        self.needs_redraw = not DIRTY_RENDERING or self.state != drawn_state
+
+    def run_frame(self, elapsed):
+        # One frame of whichever scene the state picks; False once the window
+        # is closed
+        scene = self.scenes[self.state]
+        if scene is not self.scene:
+            if self.scene is not None:
+                self.scene.exit()
+            scene.enter()
+            self.scene = scene
+            self.needs_redraw = True
+        for event in self.get_events():
+            if event.type == pygame.QUIT:
+                return False
+            if not scene.widgets.dispatch(event):
+                scene.handle(event)
+        scene.update(elapsed)
+        scene.draw()
         return True
 
-# Key mappings
-player1_keys = [pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d]
-player2_keys = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+    def start_match(self):
+        self.state = "PLAYING"
+        self.timestep.reset()
+        self.matches_started += 1
+        self.cpu = None
+        local = self.net is None and self.replay is None and self.feed is None
+        if local and self.cpu_level is not None:
+            self.cpu = PlannerPolicy(random.Random(), self.sim, budget=DIFFICULTIES[self.cpu_level])
+        if self.net is not None:
+            from netplay import NetplayDriver
+            sock, local_index, peer_addr = self.net
+            self.driver = NetplayDriver(self.sim, local_index, sock, peer_addr, self.matches_started,
+                                        keep_settled=self.telemetry is not None)
+        elif self.record_dir and self.replay is None and self.feed is None:
+            self.driver = ReplayRecorder(self.sim, (self.player1_name, self.player2_name))
+        if self.telemetry is not None:
+            mode = "replay" if self.replay else "spectate" if self.feed else "online" if self.net else "local"
+            if self.cpu is not None:
+                mode = f"cpu-{self.cpu_level}"
+            self.telemetry.start_match(self.sim, (self.player1_name, self.player2_name),
+                                       (self.player1_skin, self.player2_skin), mode)
+
+    def log_tick(self, state):
+        # Online, the state just stepped may still be rolled back; only ticks
+        # the driver has settled are logged
+        settled = getattr(self.driver, "settled", None)
+        if settled is None:
+            self.telemetry.record_tick(state)
+            return
+        while settled:
+            self.telemetry.record_snapshot(settled.popleft())
+
+    def leave_broadcast(self):
+        # Nothing is left to watch, so the game goes on as a local one from
+        # the menu
+        self.finish_match()
+        self.feed.close()
+        self.feed = None
+        self.setup_game_objects()
+        self.state = "MENU"
 
-def main():
+    def finish_match(self):
+        if self.telemetry is not None:
+            self.telemetry.end_match(self.sim.state)
+        if isinstance(self.driver, ReplayRecorder):
+            os.makedirs(self.record_dir, exist_ok=True)
+            self.driver.save(os.path.join(self.record_dir, time.strftime("match-%Y%m%d-%H%M%S.pgr")))
+        # A watched replay only plays once
+        self.replay = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pixel Gladiators")
+    parser.add_argument("--record", metavar="DIR", help="save a replay of every match to DIR")
+    # A replay, an online match and a broadcast each drive the match their
+    # own way, so only one can be picked
+    online = parser.add_mutually_exclusive_group()
+    online.add_argument("--replay", metavar="FILE", help="watch a recorded match")
+    online.add_argument("--host", type=int, metavar="PORT", help="play online as player 1, waiting on PORT")
+    online.add_argument("--connect", metavar="HOST:PORT", help="play online as player 2 against a host")
+    online.add_argument("--spectate", metavar="HOST:PORT", help="watch a broadcast server's match")
+    parser.add_argument("--controls", metavar="FILE", help="load key and controller bindings from FILE and save rebinds to it")
+    parser.add_argument("--profile", action="store_true", help="start with the profiler HUD shown (F3)")
+    parser.add_argument("--trace", metavar="FILE", help="write the last frames' timings to a Chrome trace on exit")
+    parser.add_argument("--telemetry", metavar="DIR", help="log every match's ticks, hits and result to DIR")
+    parser.add_argument("--cpu", choices=list(DIFFICULTIES), help="player 2 is the CPU at this difficulty")
+    args = parser.parse_args(argv)
+    # Recordings are of inputs fed to the local simulation; the others don't
+    # step it that way, so nothing would be saved
+    if args.record and (args.replay or args.host is not None or args.connect or args.spectate):
+        parser.error("--record only works for matches played on this machine")
+
+    replay = Replay.load(args.replay) if args.replay else None
+    # The online modules are only imported when used; asyncio alone would
+    # add tens of milliseconds to every start
+    net = None
+    if args.host is not None:
+        from netplay import open_socket
+        net = (open_socket(args.host), 0, None)
+    elif args.connect:
+        from netplay import open_socket
+        host, _, port = args.connect.rpartition(":")
+        net = (open_socket(), 1, (host, int(port)))
+    feed = None
+    if args.spectate:
+        from broadcast import SpectatorFeed
+        host, _, port = args.spectate.rpartition(":")
+        feed = SpectatorFeed(host, int(port))
+    telemetry = None
+    if args.telemetry:
+        from telemetry import Telemetry
+        telemetry = Telemetry(args.telemetry)
+    init_display()
     clock = pygame.time.Clock()
-    game = Game()
-
+    game = Game(record_dir=args.record, replay=replay, net=net, feed=feed, controls_file=args.controls,
+                telemetry=telemetry, cpu=args.cpu)
+    if args.trace:
+        PROFILER.start_trace()
+    if args.profile:
+        game.toggle_hud()
+
+    elapsed = 0.0
     running = True
     while running:
-        if game.state == "MENU":
-            running = game.run_menu()
-        elif game.state == "PREP":
-            running = game.run_prep_screen()
-        elif game.state == "CUSTOMIZE":
-            running = game.run_customize_screen()
-        elif game.state == "PLAYING":
-            running = game.run_game()
-        elif game.state == "GAME_OVER":
-            running = game.run_game_over()
-
-        pygame.display.flip()
-        clock.tick(FPS)
-
+        state = game.state
+        with PROFILER.stage(state.lower()):
+            running = game.run_frame(elapsed)
+
+        game.present(state)
+        # Also caps idle screens at FPS through bursts of input; after a long
+        # idle wait it returns at once
+        with PROFILER.stage("wait"):
+            elapsed = clock.tick(FPS) / 1000.0
+        if state != "PLAYING":
+            elapsed = 0.0  # Time spent on other screens is not match time
+        PROFILER.end_frame()
+
+    if args.trace:
+        print(f"Wrote {PROFILER.dump_trace(args.trace)} trace events to {args.trace}")
+    if telemetry is not None:
+        # A match still going when the window closed ends with no winner
+        telemetry.end_match(game.sim.state)
+        telemetry.close()
+    ASSETS.shutdown()
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pygame
+
+# Frame profiler: named stage timers and per-frame counters, an on-screen HUD
+# (F3 in game) and a ring buffer of trace events that dumps to Chrome's trace
+# format, which chrome://tracing and ui.perfetto.dev open directly.
+#
+# While disabled, stage() hands back one shared no-op context manager and
+# count() returns straight away, so instrumented code costs a method call.
+
+HISTORY_FRAMES = 240  # Frame times kept for the graph and percentiles
+TRACE_EVENTS = 100000  # Trace events kept in the ring buffer
+HUD_REFRESH = 0.25  # Seconds between HUD text updates
+FRAME_BUDGET = 1 / 60
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler.stage_times[self.name] = profiler.stage_times.get(self.name, 0.0) + end - self.start
+        if profiler.trace is not None:
+            profiler.trace.append((self.name, self.start, end - self.start))
+        return False
+
+
+class Profiler:
+    def __init__(self, history=HISTORY_FRAMES):
+        self.enabled = False
+        self.frame_times = deque(maxlen=history)
+        self.stage_times = {}  # Seconds per stage so far this frame
+        self.counters = {}  # Counts so far this frame
+        self.last_stage_times = {}  # The previous frame's, for the HUD
+        self.last_counters = {}
+        self.trace = None  # (name, start, duration) ring buffer once tracing
+        self.frame_start = time.perf_counter()
+        self.frames = 0
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.stage_times = {}
+        self.counters = {}
+        self.frame_start = time.perf_counter()
+
+    def start_trace(self, max_events=TRACE_EVENTS):
+        self.trace = deque(maxlen=max_events)
+        self.enable()
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frame_times.append(now - self.frame_start)
+        if self.trace is not None:
+            self.trace.append(("frame", self.frame_start, now - self.frame_start))
+        self.frame_start = now
+        self.last_stage_times, self.stage_times = self.stage_times, {}
+        self.last_counters, self.counters = self.counters, {}
+        self.frames += 1
+
+    def percentiles(self, fractions=(0.5, 0.95, 0.99)):
+        times = sorted(self.frame_times)
+        if not times:
+            return [0.0] * len(fractions)
+        return [times[min(int(len(times) * fraction), len(times) - 1)] for fraction in fractions]
+
+    def dump_trace(self, path):
+        # Frames and stages as complete ("X") events, in microseconds
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": tid}
+                  for name, start, duration in self.trace or ()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+class ProfilerHud:
+    # Drawn last each frame over whatever the handler drew, and erased again
+    # before the next frame so dirty-rect rendering never sees it
+    GRAPH_HEIGHT = 60
+    LINE_HEIGHT = 14
+
+    def __init__(self, profiler, font, pos=(10, 60), width=240):
+        self.profiler = profiler
+        self.font = font
+        self.width = width
+        self.lines = []
+        self.next_refresh = 0.0
+        self.rect = pygame.Rect(pos, (width, self.GRAPH_HEIGHT))
+        self.saved = None  # What the HUD covers on the screen
+
+    def refresh_text(self):
+        profiler = self.profiler
+        p50, p95, p99 = profiler.percentiles()
+        worst = max(profiler.frame_times, default=0.0)
+        text = [f"frame ms p50 {1000 * p50:.1f} p95 {1000 * p95:.1f} p99 {1000 * p99:.1f} max {1000 * worst:.1f}"]
+        for name, seconds in sorted(profiler.last_stage_times.items(), key=lambda item: -item[1]):
+            text.append(f"{name:12} {1000 * seconds:7.2f} ms")
+        text.extend(f"{name:12} {count:7d}" for name, count in sorted(profiler.last_counters.items()))
+        self.lines = [self.font.render(line, True, (255, 255, 255)) for line in text]
+        self.rect.height = self.GRAPH_HEIGHT + self.LINE_HEIGHT * len(self.lines) + 4
+
+    def erase(self, surface):
+        if self.saved is not None:
+            surface.blit(self.saved, self.rect)
+            self.saved = None
+            return self.rect.copy()
+        return None
+
+    def draw(self, surface):
+        now = time.perf_counter()
+        if now >= self.next_refresh:
+            self.refresh_text()
+            self.next_refresh = now + HUD_REFRESH
+        self.saved = surface.subsurface(self.rect.clip(surface.get_rect())).copy()
+
+        panel = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+
+        # One bar per frame, the line marking a 60 FPS frame
+        times = self.profiler.frame_times
+        scale = self.GRAPH_HEIGHT / (2 * FRAME_BUDGET)
+        bar = self.width / times.maxlen
+        for i, seconds in enumerate(times):
+            height = min(seconds * scale, self.GRAPH_HEIGHT)
+            color = (80, 220, 80) if seconds <= FRAME_BUDGET * 1.05 else (240, 80, 60)
+            panel.fill(color, (i * bar, self.GRAPH_HEIGHT - height, max(bar, 1), height))
+        budget_y = self.GRAPH_HEIGHT - FRAME_BUDGET * scale
+        pygame.draw.line(panel, (255, 255, 0), (0, budget_y), (self.width, budget_y))
+
+        for i, line in enumerate(self.lines):
+            panel.blit(line, (4, self.GRAPH_HEIGHT + 2 + i * self.LINE_HEIGHT))
+        surface.blit(panel, self.rect)
+        return self.rect.copy()
@@ -0,0 +1,263 @@
+import argparse
+import bisect
+import json
+import struct
+import sys
+import time
+import zlib
+
+from sim import Simulation, Rules, pack_snapshot, unpack_snapshot, SNAPSHOT_STRUCT
+
+# Match replays: the per-tick input bitmasks that drove a match, which is all
+# the deterministic simulation needs to play it again.
+#
+# File layout: MAGIC, a version byte, a length-prefixed JSON header (tick rate,
+# rules, player names, intervals), then one zlib-compressed payload holding
+#   - input runs: (length, value) varint pairs, value packing both players'
+#     bitmasks, a new run only starting when someone's keys change
+#   - keyframes: (tick, packed snapshot) pairs to seek from
+#   - state hashes: a CRC32 every hash_interval ticks to catch desyncs
+# A five minute match comes to a few KB.
+#
+#   python replay.py match.pgr            play it headless at full speed
+#   python replay.py match.pgr --seek 600 jump to a tick through keyframes
+#   python pg.py --replay match.pgr       watch it at 1x
+
+MAGIC = b"PGRP"
+VERSION = 1
+KEYFRAME_SECONDS = 10
+HASH_SECONDS = 1
+PLAYER_BITS = 5  # Bits per player in a packed input value
+
+
+class DesyncError(Exception):
+    pass
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def pack_inputs(inputs):
+    return inputs[0] | inputs[1] << PLAYER_BITS
+
+
+def unpack_inputs(value):
+    return (value & ((1 << PLAYER_BITS) - 1), value >> PLAYER_BITS)
+
+
+class ReplayRecorder:
+    # Stands in for the simulation's step(): records the inputs, then steps
+    def __init__(self, sim, names=("Player 1", "Player 2")):
+        self.sim = sim
+        self.header = {
+            "tick_rate": sim.tick_rate,
+            "rules": sim.rules.as_dict(),
+            "names": list(names),
+            "keyframe_interval": KEYFRAME_SECONDS * sim.tick_rate,
+            "hash_interval": HASH_SECONDS * sim.tick_rate,
+        }
+        self.keyframe_interval = self.header["keyframe_interval"]
+        self.hash_interval = self.header["hash_interval"]
+        self.runs = []  # [length, value] pairs
+        self.keyframes = []  # (tick, packed snapshot)
+        self.hashes = []
+
+    @property
+    def state(self):
+        return self.sim.state
+
+    def step(self, inputs):
+        sim = self.sim
+        tick = sim.state.tick
+        if sim.state.winner is not None:
+            return sim.state
+        if tick % self.keyframe_interval == 0:
+            self.keyframes.append((tick, pack_snapshot(sim.snapshot())))
+
+        value = pack_inputs(inputs)
+        if self.runs and self.runs[-1][1] == value:
+            self.runs[-1][0] += 1
+        else:
+            self.runs.append([1, value])
+
+        state = sim.step(inputs)
+        if state.tick % self.hash_interval == 0:
+            self.hashes.append(sim.state_hash())
+        return state
+
+    def to_bytes(self):
+        payload = bytearray()
+        write_varint(payload, len(self.runs))
+        for length, value in self.runs:
+            write_varint(payload, length)
+            write_varint(payload, value)
+        write_varint(payload, len(self.keyframes))
+        for tick, snapshot in self.keyframes:
+            write_varint(payload, tick)
+            payload += snapshot
+        write_varint(payload, len(self.hashes))
+        for state_hash in self.hashes:
+            payload += struct.pack("<I", state_hash)
+
+        header = json.dumps(self.header).encode()
+        return MAGIC + struct.pack("<BI", VERSION, len(header)) + header + zlib.compress(bytes(payload), 9)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+class Replay:
+    # A parsed replay file
+    def __init__(self, header, runs, keyframes, hashes):
+        self.header = header
+        self.tick_rate = header["tick_rate"]
+        self.rules = Rules(**header["rules"])
+        self.names = header["names"]
+        self.keyframe_interval = header["keyframe_interval"]
+        self.hash_interval = header["hash_interval"]
+        self.keyframes = keyframes  # (tick, snapshot) in tick order
+        self.keyframe_ticks = [tick for tick, _ in keyframes]
+        self.hashes = hashes
+
+        # Start tick of every run, for bisecting to any tick
+        self.run_starts = []
+        self.run_values = []
+        tick = 0
+        for length, value in runs:
+            self.run_starts.append(tick)
+            self.run_values.append(value)
+            tick += length
+        self.length = tick  # Ticks in the match
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != MAGIC:
+            raise ValueError("Not a Pixel Gladiators replay")
+        version, header_size = struct.unpack_from("<BI", data, 4)
+        if version != VERSION:
+            raise ValueError(f"Unsupported replay version {version}")
+        pos = 9 + header_size
+        header = json.loads(data[9:pos])
+        payload = zlib.decompress(data[pos:])
+
+        pos = 0
+        count, pos = read_varint(payload, pos)
+        runs = []
+        for _ in range(count):
+            length, pos = read_varint(payload, pos)
+            value, pos = read_varint(payload, pos)
+            runs.append((length, value))
+        count, pos = read_varint(payload, pos)
+        keyframes = []
+        for _ in range(count):
+            tick, pos = read_varint(payload, pos)
+            keyframes.append((tick, unpack_snapshot(payload[pos:pos + SNAPSHOT_STRUCT.size])))
+            pos += SNAPSHOT_STRUCT.size
+        count, pos = read_varint(payload, pos)
+        hashes = list(struct.unpack_from(f"<{count}I", payload, pos))
+        return cls(header, runs, keyframes, hashes)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayPlayer:
+    # Stands in for the simulation's step(), feeding it the recorded inputs
+    def __init__(self, replay, verify=True):
+        self.replay = replay
+        self.verify = verify
+        self.sim = Simulation(tick_rate=replay.tick_rate, rules=replay.rules)
+        self.run_index = 0
+        if replay.keyframes:
+            # Start from the recorded state rather than assuming the default one
+            self.sim.restore(replay.keyframes[0][1])
+
+    @property
+    def state(self):
+        return self.sim.state
+
+    @property
+    def finished(self):
+        return self.sim.state.tick >= self.replay.length or self.sim.state.winner is not None
+
+    def step(self, inputs=None):
+        # inputs is ignored; the recording decides
+        replay = self.replay
+        state = self.sim.state
+        if self.finished:
+            return state
+        tick = state.tick
+        while self.run_index + 1 < len(replay.run_starts) and replay.run_starts[self.run_index + 1] <= tick:
+            self.run_index += 1
+        state = self.sim.step(unpack_inputs(replay.run_values[self.run_index]))
+
+        if self.verify and state.tick % replay.hash_interval == 0:
+            i = state.tick // replay.hash_interval - 1
+            if i < len(replay.hashes) and replay.hashes[i] != self.sim.state_hash():
+                raise DesyncError(f"Replay desynced at tick {state.tick}")
+        return state
+
+    def seek(self, tick):
+        # Restore the last keyframe at or before tick, then simulate the rest.
+        # Every recording has a keyframe at tick 0
+        replay = self.replay
+        i = bisect.bisect_right(replay.keyframe_ticks, tick) - 1
+        current = self.sim.state.tick
+        # Simulating on from the current tick beats a restore when it is closer
+        if not replay.keyframe_ticks[i] <= current <= tick:
+            self.sim.restore(replay.keyframes[i][1])
+        self.run_index = max(bisect.bisect_right(self.replay.run_starts, self.sim.state.tick) - 1, 0)
+        while self.sim.state.tick < tick and not self.finished:
+            self.step()
+        return self.sim.state
+
+    def run(self):
+        while not self.finished:
+            self.step()
+        return self.sim.state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a Pixel Gladiators replay headless.")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, help="stop at this tick instead of the end")
+    parser.add_argument("--no-verify", action="store_true", help="skip state hash checks")
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.path)
+    player = ReplayPlayer(replay, verify=not args.no_verify)
+    start = time.perf_counter()
+    try:
+        state = player.seek(args.seek) if args.seek is not None else player.run()
+    except DesyncError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - start
+
+    names = replay.names
+    print(f"{names[0]} vs {names[1]}: {replay.length} ticks at {replay.tick_rate} Hz, "
+          f"{len(replay.keyframes)} keyframes, {len(replay.hashes)} hashes")
+    health = ", ".join(f"{name} {fighter.health:g}" for name, fighter in zip(names, state.fighters))
+    winner = names[state.winner - 1] if state.winner else "nobody"
+    print(f"tick {state.tick}: {health}; winner {winner} ({state.tick / max(elapsed, 1e-9):.0f} ticks/s)")
+
+
+if __name__ == "__main__":
+    main()
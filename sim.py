@@ -0,0 +1,266 @@
+import struct
+import zlib
+
+# Headless match simulation for Pixel Gladiators.
+#
+# Nothing in this module touches pygame: there is no window, surface or font
+# here. pg.py renders the state produced by Simulation.step, but batch jobs and
+# test harnesses can drive a match on its own, thousands of ticks per second.
+#
+# Speeds, gravity and damage below are tuned per 1/60 s frame. The simulation
+# runs at its own fixed tick rate and scales them, so a match plays the same
+# whatever the tick rate or the render rate.
+
+# Timing settings
+BASE_TICK_RATE = 60  # Rate the per-frame constants below were tuned for
+TICK_RATE = 120  # Logic updates per second
+MAX_TICKS_PER_FRAME = 8  # Drop simulation time beyond this rather than spiral
+
+# Arena settings
+ARENA_WIDTH = 800
+ARENA_HEIGHT = 600
+
+# Player settings
+PLAYER_WIDTH = 50
+PLAYER_HEIGHT = 50
+PLAYER_SPEED = 5
+GRAVITY = 0.8
+JUMP_SPEED = -15
+MAX_HEALTH = 100
+
+# Sword settings
+SWORD_WIDTH = 10
+SWORD_HEIGHT = 40
+SWORD_DAMAGE = 5  # Damage inflicted by a sword hit
+SWORD_IDLE_POS = (-100, -100)  # Where a sword is parked when not attacking
+
+# Input bits, one small int per player per tick
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+INPUT_ATTACK = 16
+
+
+def rects_overlap(a, b):
+    # Same test as pygame.Rect.colliderect for (x, y, width, height) tuples
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+class Rules:
+    # Balance values a match is played with. The defaults are the module
+    # constants; batch runs override them to sweep parameter grids
+    FIELDS = {
+        "player_speed": PLAYER_SPEED,
+        "gravity": GRAVITY,
+        "jump_speed": JUMP_SPEED,
+        "sword_damage": SWORD_DAMAGE,
+        "max_health": MAX_HEALTH,
+        # When set, a swing hits a given fighter once for the full
+        # sword_damage instead of sword_damage every frame of overlap
+        "one_hit_per_swing": False,
+    }
+
+    def __init__(self, **overrides):
+        for name, default in self.FIELDS.items():
+            setattr(self, name, overrides.pop(name, default))
+        if overrides:
+            raise TypeError(f"Unknown rule(s): {', '.join(sorted(overrides))}")
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+DEFAULT_RULES = Rules()
+
+
+class Fighter:
+    __slots__ = ("x", "y", "prev_x", "prev_y", "velocity_y", "jumping", "health", "attacking",
+                 "swing", "landed_swing")
+
+    def __init__(self, x, y, health=MAX_HEALTH):
+        self.x = x
+        self.y = y
+        # Position at the start of the last tick, for interpolated rendering
+        self.prev_x = x
+        self.prev_y = y
+        self.velocity_y = 0
+        self.jumping = False
+        self.health = health
+        self.attacking = False
+        self.swing = 0  # Counts attacks started
+        self.landed_swing = 0  # Last swing that hit, for Rules.one_hit_per_swing
+
+    def rect(self):
+        return (self.x, self.y, PLAYER_WIDTH, PLAYER_HEIGHT)
+
+    def sword_rect(self):
+        if not self.attacking:
+            return (SWORD_IDLE_POS[0], SWORD_IDLE_POS[1], SWORD_WIDTH, SWORD_HEIGHT)
+        # The sword is centered on its owner while attacking
+        x = self.x + PLAYER_WIDTH // 2 - SWORD_WIDTH // 2
+        y = self.y + PLAYER_HEIGHT // 2 - SWORD_HEIGHT // 2
+        return (x, y, SWORD_WIDTH, SWORD_HEIGHT)
+
+
+# Binary layout of Simulation.snapshot(): tick and winner, then each fighter's
+# slots in Fighter.__slots__ order
+SNAPSHOT_STRUCT = struct.Struct("<Ib" + "5d?d?2I" * 2)
+
+
+def pack_snapshot(snapshot):
+    tick, winner, fighters = snapshot
+    values = [tick, winner or 0]
+    for fighter in fighters:
+        values.extend(fighter)
+    return SNAPSHOT_STRUCT.pack(*values)
+
+
+def unpack_snapshot(data):
+    values = SNAPSHOT_STRUCT.unpack(data)
+    size = len(Fighter.__slots__)
+    fighters = tuple(values[i:i + size] for i in range(2, len(values), size))
+    return (values[0], values[1] or None, fighters)
+
+
+def snapshot_state(state):
+    # Plain tuples, cheap to keep around and to compare. Nothing can change
+    # them, so any number of searches can share one and restore from it
+    return (state.tick, state.winner,
+            tuple(tuple(getattr(fighter, name) for name in Fighter.__slots__) for fighter in state.fighters))
+
+
+class MatchState:
+    def __init__(self, fighters):
+        self.fighters = fighters
+        self.tick = 0
+        self.winner = None  # 1 or 2 once a fighter's health reaches zero
+
+
+class Simulation:
+    def __init__(self, width=ARENA_WIDTH, height=ARENA_HEIGHT, tick_rate=TICK_RATE, rules=DEFAULT_RULES):
+        self.width = width
+        self.height = height
+        self.tick_rate = tick_rate
+        self.rules = rules
+        # Fraction of a tuning frame covered by one tick
+        self.scale = BASE_TICK_RATE / tick_rate
+        self.reset()
+
+    def reset(self):
+        health = self.rules.max_health
+        self.state = MatchState([
+            Fighter(100, self.height // 2, health),
+            Fighter(self.width - 150, self.height // 2, health),
+        ])
+        return self.state
+
+    def move(self, fighter, bits):
+        rules = self.rules
+        scale = self.scale
+        fighter.prev_x = fighter.x
+        fighter.prev_y = fighter.y
+
+        # Horizontal movement
+        if bits & INPUT_LEFT and fighter.x > 0:
+            fighter.x -= rules.player_speed * scale
+        if bits & INPUT_RIGHT and fighter.x + PLAYER_WIDTH < self.width:
+            fighter.x += rules.player_speed * scale
+
+        # Jumping and gravity
+        if bits & INPUT_UP and not fighter.jumping:
+            fighter.velocity_y = rules.jump_speed
+            fighter.jumping = True
+
+        fighter.velocity_y += rules.gravity * scale
+        fighter.y += fighter.velocity_y * scale
+
+        # Check floor collision
+        if fighter.y + PLAYER_HEIGHT > self.height:
+            fighter.y = self.height - PLAYER_HEIGHT
+            fighter.velocity_y = 0
+            fighter.jumping = False
+
+    def step(self, inputs):
+        # inputs holds one INPUT_* bitmask per fighter
+        state = self.state
+        if state.winner is not None:
+            return state
+
+        fighter1, fighter2 = state.fighters
+        for fighter, bits in zip(state.fighters, inputs):
+            self.move(fighter, bits)
+            attacking = bool(bits & INPUT_ATTACK)
+            if attacking and not fighter.attacking:
+                fighter.swing += 1
+            fighter.attacking = attacking
+
+        # Both hits land in the same tick, so a trade can knock out both fighters
+        hit2 = fighter1.attacking and rects_overlap(fighter1.sword_rect(), fighter2.rect())
+        hit1 = fighter2.attacking and rects_overlap(fighter2.sword_rect(), fighter1.rect())
+        if self.rules.one_hit_per_swing:
+            damage = self.rules.sword_damage
+            hit2 = hit2 and fighter1.landed_swing != fighter1.swing
+            hit1 = hit1 and fighter2.landed_swing != fighter2.swing
+        else:
+            damage = self.rules.sword_damage * self.scale
+        if hit2:
+            fighter1.landed_swing = fighter1.swing
+            fighter2.health = max(fighter2.health - damage, 0)
+        if hit1:
+            fighter2.landed_swing = fighter2.swing
+            fighter1.health = max(fighter1.health - damage, 0)
+
+        if fighter1.health <= 0:
+            state.winner = 2
+        elif fighter2.health <= 0:
+            state.winner = 1
+
+        state.tick += 1
+        return state
+
+    def snapshot(self):
+        return snapshot_state(self.state)
+
+    def restore(self, snapshot):
+        # Writes into the existing fighters, so sprites drawing them stay valid
+        tick, winner, fighters = snapshot
+        state = self.state
+        state.tick = tick
+        state.winner = winner
+        for fighter, values in zip(state.fighters, fighters):
+            for name, value in zip(Fighter.__slots__, values):
+                setattr(fighter, name, value)
+
+    def state_hash(self):
+        return zlib.crc32(pack_snapshot(self.snapshot()))
+
+
+class FixedTimestep:
+    # Accumulates real time and hands out whole simulation ticks
+    def __init__(self, tick_rate=TICK_RATE, max_ticks=MAX_TICKS_PER_FRAME):
+        self.dt = 1.0 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+
+    def advance(self, elapsed):
+        # elapsed is the real time in seconds since the previous call
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            # Too far behind (a stall or a breakpoint): skip ahead instead of
+            # trying to catch up and falling further behind
+            ticks = self.max_ticks
+            self.accumulator = ticks * self.dt
+        self.accumulator -= ticks * self.dt
+        return ticks
+
+    @property
+    def alpha(self):
+        # How far the renderer is between the previous and the current tick
+        return self.accumulator / self.dt
+
+    def reset(self):
+        self.accumulator = 0.0
@@ -0,0 +1,227 @@
+import pygame
+
+from sim import PLAYER_WIDTH, PLAYER_HEIGHT, SWORD_WIDTH, SWORD_HEIGHT
+
+# Fighter skins. Every frame of a skin (idle, walk and jump animations and the
+# sword at each angle of its swing) is painted once, packed into a single
+# atlas surface, and the whole atlas is flipped once for fighters facing left.
+# Drawing a fighter is then picking a subsurface out of one of two atlases:
+# no flips, rotations or new surfaces per frame, and one texture per skin and
+# facing however many frames it has.
+#
+# Frames are painted facing right. A skin only describes how to paint them;
+# the built-in ones below are drawn with pygame.draw, but the packer takes any
+# surfaces.
+
+ATLAS_WIDTH = 256
+ANIMATION_MS = 120  # Each idle or walk frame
+SWING_MS = 25  # Each sword swing frame
+COLORKEY = (255, 0, 255)  # Transparent pixels in the atlas
+DEFAULT_SKIN = "Classic"
+
+# Sword angles through a swing, in degrees counterclockwise from upright: it
+# starts leaning back and ends pointing forward
+SWING_ANGLES = (60, 30, 0, -30, -60)
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+STEEL = (190, 195, 205)
+
+
+def shade(color, amount):
+    return tuple(max(0, min(255, c + amount)) for c in color)
+
+
+def pack(sizes, width=ATLAS_WIDTH):
+    # Shelf packing, tallest first: frames fill a row left to right and the
+    # next row starts below the tallest one. Returns each frame's position in
+    # the order given and the atlas height
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if w > width:
+            raise ValueError(f"Frame {w}px wide does not fit a {width}px atlas")
+        if x + w > width:
+            x, y, shelf = 0, y + shelf, 0
+        positions[i] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+    return positions, y + shelf
+
+
+class SkinAtlas:
+    def __init__(self, frames, opaque=False):
+        # frames: {(animation, index): surface}. Opaque skins skip the
+        # colorkey, which keeps their blits as cheap as a plain fill's
+        keys = list(frames)
+        positions, height = pack([frames[key].get_size() for key in keys])
+        atlas = pygame.Surface((ATLAS_WIDTH, height))
+        atlas.fill(COLORKEY)
+        for key, pos in zip(keys, positions):
+            atlas.blit(frames[key], pos)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert()
+        mirrored = pygame.transform.flip(atlas, True, False)
+        if not opaque:
+            atlas.set_colorkey(COLORKEY)
+            mirrored.set_colorkey(COLORKEY)
+        self.atlases = (atlas, mirrored)
+
+        self.frames = {}  # (animation, index, facing_left) -> subsurface
+        self.counts = {}  # animation -> number of frames
+        for key, (x, y) in zip(keys, positions):
+            w, h = frames[key].get_size()
+            self.frames[key + (False,)] = atlas.subsurface((x, y, w, h))
+            self.frames[key + (True,)] = mirrored.subsurface((ATLAS_WIDTH - x - w, y, w, h))
+            animation, index = key
+            self.counts[animation] = max(self.counts.get(animation, 0), index + 1)
+        self.previews = {}
+
+    def frame(self, animation, index, facing_left=False):
+        # Animations loop; index can be any running count
+        return self.frames[(animation, index % self.counts[animation], facing_left)]
+
+    def preview(self, size):
+        # First idle frame scaled for the skin picker, once per size
+        surface = self.previews.get(size)
+        if surface is None:
+            surface = self.previews[size] = pygame.transform.scale(self.frame("idle", 0), size)
+        return surface
+
+
+class Skin:
+    # Subclasses paint frames onto PLAYER_WIDTH x PLAYER_HEIGHT (or sword
+    # sized) surfaces filled with COLORKEY; color is the player's team color
+    idle_frames = 1
+    walk_frames = 1
+    swing_angles = SWING_ANGLES
+    opaque = False
+
+    def paint_body(self, surface, color, animation, index):
+        raise NotImplementedError
+
+    def paint_sword(self, surface, color):
+        surface.fill(STEEL)
+        surface.fill(color, (0, SWORD_HEIGHT - 8, SWORD_WIDTH, 8))  # Hilt
+
+    def build(self, color):
+        frames = {}
+        for animation, count in (("idle", self.idle_frames), ("walk", self.walk_frames), ("jump", 1)):
+            for index in range(count):
+                surface = pygame.Surface((PLAYER_WIDTH, PLAYER_HEIGHT))
+                surface.fill(COLORKEY)
+                self.paint_body(surface, color, animation, index)
+                frames[(animation, index)] = surface
+
+        sword = pygame.Surface((SWORD_WIDTH, SWORD_HEIGHT))
+        sword.fill(COLORKEY)
+        self.paint_sword(sword, color)
+        sword.set_colorkey(COLORKEY)  # rotate() pads with the colorkey
+        for index, angle in enumerate(self.swing_angles):
+            frames[("swing", index)] = pygame.transform.rotate(sword, angle) if angle else sword
+        return SkinAtlas(frames, self.opaque)
+
+
+class ClassicSkin(Skin):
+    # The original flat team-colored blocks
+    swing_angles = (0,)
+    opaque = True
+
+    def paint_body(self, surface, color, animation, index):
+        surface.fill(color)
+
+    def paint_sword(self, surface, color):
+        surface.fill(color)
+
+
+class KnightSkin(Skin):
+    idle_frames = 2
+    walk_frames = 4
+
+    def paint_body(self, surface, color, animation, index):
+        bob = index % 2 if animation == "idle" else 0
+        armor = (150, 155, 165)
+        # Plume, helmet with a visor slit on the facing side, then the body
+        pygame.draw.rect(surface, color, (18, bob, 14, 8))
+        pygame.draw.rect(surface, armor, (10, 6 + bob, 30, 20))
+        pygame.draw.rect(surface, BLACK, (26, 13 + bob, 12, 4))
+        pygame.draw.rect(surface, shade(armor, -30), (8, 26, 34, 14))
+        pygame.draw.rect(surface, color, (8, 30, 34, 4))  # Team sash
+        # Legs, striding apart when walking or tucked when jumping
+        if animation == "walk":
+            stride = (0, 4, 0, -4)[index]
+            pygame.draw.rect(surface, armor, (13 - stride, 40, 9, 10))
+            pygame.draw.rect(surface, armor, (28 + stride, 40, 9, 10))
+        elif animation == "jump":
+            pygame.draw.rect(surface, armor, (13, 40, 24, 6))
+        else:
+            pygame.draw.rect(surface, armor, (13, 40, 9, 10))
+            pygame.draw.rect(surface, armor, (28, 40, 9, 10))
+
+
+class NinjaSkin(Skin):
+    idle_frames = 2
+    walk_frames = 4
+
+    def paint_body(self, surface, color, animation, index):
+        cloth = (35, 35, 45)
+        pygame.draw.rect(surface, cloth, (12, 0, 26, 50))
+        # Headband with its tails trailing behind, waving while moving
+        pygame.draw.rect(surface, color, (12, 8, 26, 5))
+        wave = index % 2 if animation != "jump" else 1
+        pygame.draw.line(surface, color, (12, 10), (2, 6 + 6 * wave), 3)
+        pygame.draw.rect(surface, WHITE, (28, 16, 8, 3))  # Eyes
+        if animation == "walk":
+            stride = (0, 5, 0, -5)[index]
+            surface.fill(COLORKEY, (22 + stride, 36, 6, 14))
+        elif animation == "jump":
+            surface.fill(COLORKEY, (12, 42, 26, 8))
+        else:
+            surface.fill(COLORKEY, (23, 38, 4, 12))
+
+    def paint_sword(self, surface, color):
+        surface.fill(STEEL, (2, 0, SWORD_WIDTH - 4, SWORD_HEIGHT))
+        surface.fill(BLACK, (0, SWORD_HEIGHT - 12, SWORD_WIDTH, 12))
+        surface.fill(color, (0, SWORD_HEIGHT - 12, SWORD_WIDTH, 2))
+
+
+class SlimeSkin(Skin):
+    idle_frames = 4
+    walk_frames = 4
+
+    def paint_body(self, surface, color, animation, index):
+        # Squashes and stretches; always sits on the bottom edge
+        if animation == "jump":
+            width, height = 40, 50
+        else:
+            squash = (0, 3, 6, 3)[index] if animation == "idle" else (0, 6, 10, 6)[index]
+            width, height = 44 + squash, 42 - squash
+        body = pygame.Rect(0, 0, width, height)
+        body.midbottom = (PLAYER_WIDTH // 2, PLAYER_HEIGHT)
+        pygame.draw.ellipse(surface, shade(color, -60), body)
+        pygame.draw.ellipse(surface, color, body.inflate(-6, -6))
+        eye = (body.right - 14, body.top + height // 3)
+        pygame.draw.circle(surface, WHITE, eye, 5)
+        pygame.draw.circle(surface, BLACK, (eye[0] + 2, eye[1]), 2)
+
+
+SKINS = {
+    "Classic": ClassicSkin(),
+    "Knight": KnightSkin(),
+    "Ninja": NinjaSkin(),
+    "Slime": SlimeSkin(),
+}
+ATLASES = {}  # (skin name, color) -> SkinAtlas, built on first use
+
+
+def get_atlas(name, color):
+    atlas = ATLASES.get((name, color))
+    if atlas is None:
+        atlas = ATLASES[(name, color)] = SKINS[name].build(color)
+    return atlas
+
+
+def next_skin(name, step=1):
+    names = list(SKINS)
+    return names[(names.index(name) + step) % len(names)]
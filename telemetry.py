@@ -0,0 +1,255 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from sim import Fighter
+
+# Match telemetry: what happened in every match, for offline analysis.
+#
+# The game loop only appends small tuples to an in-memory ring buffer; a
+# background thread wakes every FLUSH_SECONDS, turns whatever has piled up
+# into JSON lines and writes them as one batch to a gzip file, starting a new
+# file every FILE_BYTES of compressed output. Nothing on the game's side waits
+# on the writer or the disk: if the writer falls behind, the oldest records
+# fall off the ring and are counted as dropped.
+#
+# Every line is a flat JSON object tagged with its match id and event:
+#   start  names, skins, mode, tick rate and rules
+#   tick   both fighters' position, health, attacking and jumping
+#   hit    attacker, target, damage and the target's health after it
+#   end    winner (0 for none), ticks, match seconds and wall seconds
+# Online, ticks are only logged once no late input can roll them back, so
+# mispredicted hits never reach the log.
+# Files are written as NAME.jsonl.gz.part and renamed once complete, so
+# anything reading a live directory only sees whole files.
+#
+#   python pg.py --telemetry telemetry
+#   python telemetry.py summarize telemetry
+
+RING_SIZE = 1 << 16  # Records held for the writer; about 9 minutes of ticks
+FLUSH_SECONDS = 2.0
+FILE_BYTES = 16 * 1024 * 1024  # Compressed size to rotate at
+COMPRESS_LEVEL = 6
+SUFFIX = ".jsonl.gz"
+PART_SUFFIX = ".part"
+# Where a tick record's per-fighter values sit in a Simulation.snapshot()
+TICK_SLOTS = tuple(Fighter.__slots__.index(name) for name in ("x", "y", "health", "attacking", "jumping"))
+
+
+def to_line(record):
+    # Runs on the writer thread; records are tuples so the game thread never
+    # builds a dict or a string
+    kind, match = record[0], record[1]
+    if kind == "tick":
+        _, _, tick, x1, y1, health1, attacking1, jumping1, x2, y2, health2, attacking2, jumping2 = record
+        row = {"match": match, "event": "tick", "tick": tick,
+               "x1": x1, "y1": y1, "health1": health1, "attacking1": attacking1, "jumping1": jumping1,
+               "x2": x2, "y2": y2, "health2": health2, "attacking2": attacking2, "jumping2": jumping2}
+    elif kind == "hit":
+        _, _, tick, attacker, target, damage, health = record
+        row = {"match": match, "event": "hit", "tick": tick, "attacker": attacker, "target": target,
+               "damage": damage, "health": health}
+    else:
+        row = {"match": match, "event": kind, **record[2]}
+    return json.dumps(row, separators=(",", ":"))
+
+
+class Telemetry:
+    def __init__(self, directory, ring_size=RING_SIZE, flush_seconds=FLUSH_SECONDS, file_bytes=FILE_BYTES):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.file_bytes = file_bytes
+        self.ring = deque(maxlen=ring_size)
+        self.dropped = 0  # Records the ring overwrote before the writer got them
+
+        # Current match, on the game thread
+        self.match = None
+        self.started = 0.0
+        self.tick_rate = 1
+        self.health = None  # Each fighter's health after the last recorded tick
+        self.tick = None  # Last tick recorded
+
+        # Writer thread state
+        self.file = None
+        self.raw = None
+        self.path = None
+        self.files = 0
+        self.prefix = f"telemetry-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.wake = threading.Event()
+        self.stopping = False
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        ring = self.ring
+        if len(ring) == ring.maxlen:
+            self.dropped += 1
+        ring.append(record)
+
+    def start_match(self, sim, names, skins, mode):
+        if self.match is not None:
+            self.end_match(sim.state)
+        self.match = uuid.uuid4().hex
+        self.started = time.time()
+        self.tick_rate = sim.tick_rate
+        self.health = [fighter.health for fighter in sim.state.fighters]
+        self.tick = sim.state.tick
+        self.append(("start", self.match, {
+            "time": self.started, "names": list(names), "skins": list(skins), "mode": mode,
+            "tick_rate": sim.tick_rate, "rules": sim.rules.as_dict(),
+        }))
+
+    def record_tick(self, state):
+        # Called after every simulation step
+        if self.match is None or state.tick == self.tick:
+            return
+        fighter1, fighter2 = state.fighters
+        self.record(state.tick, (fighter1.x, fighter1.y, fighter1.health, fighter1.attacking, fighter1.jumping),
+                    (fighter2.x, fighter2.y, fighter2.health, fighter2.attacking, fighter2.jumping))
+
+    def record_snapshot(self, snapshot):
+        # The same from a Simulation.snapshot(), for ticks that only become
+        # final later, like an online match's once its inputs are confirmed
+        tick, _, fighters = snapshot
+        if self.match is None or tick == self.tick:
+            return
+        self.record(tick, *(tuple(values[i] for i in TICK_SLOTS) for values in fighters))
+
+    def record(self, tick, fighter1, fighter2):
+        # Each fighter as (x, y, health, attacking, jumping). Hits are the
+        # health drops since the last tick; a trade records both. A finished
+        # match stops ticking but keeps being stepped, so repeats are skipped
+        self.tick = tick
+        self.append(("tick", self.match, tick) + fighter1 + fighter2)
+        health = self.health
+        if fighter1[2] != health[0] or fighter2[2] != health[1]:
+            for target, fighter in enumerate((fighter1, fighter2)):
+                if fighter[2] < health[target]:
+                    self.append(("hit", self.match, tick, 2 - target, target + 1,
+                                 health[target] - fighter[2], fighter[2]))
+            health[:] = fighter1[2], fighter2[2]
+
+    def end_match(self, state):
+        if self.match is None:
+            return
+        self.append(("end", self.match, {
+            "winner": state.winner or 0, "ticks": state.tick, "seconds": state.tick / self.tick_rate,
+            "wall_seconds": time.time() - self.started, "dropped": self.dropped,
+        }))
+        self.match = None
+        self.wake.set()  # Get the match on disk without waiting out the interval
+
+    def close(self):
+        # Writes out everything still buffered and finishes the last file
+        self.stopping = True
+        self.wake.set()
+        self.thread.join()
+
+    # Writer thread
+
+    def run(self):
+        while True:
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            stopping = self.stopping
+            self.flush()
+            if stopping:
+                break
+        self.finish_file()
+
+    def flush(self):
+        ring = self.ring
+        lines = []
+        try:
+            while True:
+                lines.append(to_line(ring.popleft()))
+        except IndexError:
+            pass
+        if not lines:
+            return
+        if self.file is None:
+            self.open_file()
+        self.file.write(("\n".join(lines) + "\n").encode())
+        if self.raw.tell() >= self.file_bytes:
+            self.finish_file()
+
+    def open_file(self):
+        self.files += 1
+        self.path = os.path.join(self.directory, f"{self.prefix}-{self.files:04d}{SUFFIX}")
+        self.raw = open(self.path + PART_SUFFIX, "wb")
+        self.file = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=COMPRESS_LEVEL)
+
+    def finish_file(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.raw.close()
+        os.replace(self.path + PART_SUFFIX, self.path)
+        self.file = self.raw = None
+
+
+def read_records(directory):
+    # Every record in the directory's finished files, one file at a time
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(SUFFIX):
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+def summarize(directory):
+    # Streams the files, keeping only per-match totals, so it runs in
+    # constant memory however many matches there are
+    matches = finished = ticks = hits = damage = 0
+    seconds = 0.0
+    wins = {}  # Winning name -> count
+    names = {}  # Match id -> names, until its end record
+    for record in read_records(directory):
+        event = record["event"]
+        if event == "start":
+            matches += 1
+            names[record["match"]] = record["names"]
+        elif event == "hit":
+            hits += 1
+            damage += record["damage"]
+        elif event == "end":
+            match_names = names.pop(record["match"], None)
+            ticks += record["ticks"]
+            seconds += record["seconds"]
+            if record["winner"]:
+                finished += 1
+                if match_names is not None:
+                    name = match_names[record["winner"] - 1]
+                    wins[name] = wins.get(name, 0) + 1
+    return {"matches": matches, "finished": finished, "ticks": ticks, "seconds": seconds,
+            "hits": hits, "damage": damage, "wins": wins}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize Pixel Gladiators match telemetry.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summarize", help="totals across every finished file in DIR")
+    summary.add_argument("directory", metavar="DIR")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        sys.exit(f"No such directory: {args.directory}")
+    totals = summarize(args.directory)
+    matches = totals["matches"]
+    print(f"{matches} matches, {totals['finished']} won, {totals['seconds']:.0f} s of play, "
+          f"{totals['hits']} hits for {totals['damage']:g} damage")
+    if matches:
+        print(f"average match {totals['seconds'] / matches:.1f} s, {totals['hits'] / matches:.1f} hits")
+    for name, count in sorted(totals["wins"].items(), key=lambda item: -item[1]):
+        print(f"{name:20} {count:8} wins")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+import pygame
+
+# Rendered text surfaces, so TrueType rasterization only happens when a string
+# actually changes instead of once per label per frame.
+
+TEXT_CACHE_SIZE = 256  # Most surfaces kept before the least recently used is dropped
+
+
+class TextCache:
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        if pygame.display.get_surface() is not None:
+            # Match the display format once here rather than on every blit
+            surface = surface.convert_alpha()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()